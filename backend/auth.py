@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Optional, Tuple
+
+import jwt
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials, HTTPBearer
+from passlib.context import CryptContext
+
+from cache import LRUCache
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# A passlib hash (argon2, bcrypt or pbkdf2_sha256) takes precedence over the plain password
+ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')  # Simple password for admin
+ADMIN_PASSWORD_HASH = os.environ.get('ADMIN_PASSWORD_HASH')
+
+# Signs admin session tokens. Without it tokens only survive until restart and
+# aren't accepted by other processes. gunicorn.conf.py picks one for all its
+# workers, set it when running more than one server.
+JWT_SECRET = os.environ.get('JWT_SECRET') or secrets.token_urlsafe(32)
+JWT_ALGORITHM = "HS256"
+ADMIN_TOKEN_TTL = int(os.environ.get('ADMIN_TOKEN_TTL', '900'))
+
+# Successful Basic verifications are remembered so legacy clients don't pay the hash cost per call
+ADMIN_AUTH_CACHE_TTL = float(os.environ.get('ADMIN_AUTH_CACHE_TTL', '300'))
+
+password_context = CryptContext(schemes=["bcrypt", "argon2", "pbkdf2_sha256"])
+
+if not os.environ.get('JWT_SECRET'):
+    logger.warning("JWT_SECRET is not set, admin tokens won't survive a restart")
+
+
+class CredentialCache:
+    """Remembers recently verified credentials by digest, never the password itself."""
+
+    def __init__(self, maxsize: int = 64, ttl: float = ADMIN_AUTH_CACHE_TTL):
+        self._entries = LRUCache(maxsize, ttl)
+        # Dependencies run in the threadpool
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(username: str, password: str) -> str:
+        return hashlib.sha256(f"{username}\0{password}".encode()).hexdigest()
+
+    def __contains__(self, credentials: Tuple[str, str]) -> bool:
+        with self._lock:
+            return self._entries.get(self._key(*credentials)) is not None
+
+    def add(self, credentials: Tuple[str, str]) -> None:
+        with self._lock:
+            self._entries.set(self._key(*credentials), True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache()
+
+
+def verify_password(password: str) -> bool:
+    if ADMIN_PASSWORD_HASH:
+        try:
+            return password_context.verify(password, ADMIN_PASSWORD_HASH)
+        except ValueError:
+            logger.error("ADMIN_PASSWORD_HASH is not a recognised passlib hash")
+            return False
+    return secrets.compare_digest(password.encode(), ADMIN_PASSWORD.encode())
+
+
+def check_credentials(credentials: HTTPBasicCredentials) -> str:
+    key = (credentials.username, credentials.password)
+    if key not in credential_cache:
+        if not verify_password(credentials.password):
+            raise HTTPException(status_code=401, detail="Invalid admin credentials")
+        credential_cache.add(key)
+    return credentials.username
+
+
+def issue_token(username: str) -> Tuple[str, int]:
+    """Return a signed admin token and its lifetime in seconds."""
+    now = int(time.time())
+    payload = {"sub": username, "iat": now, "exp": now + ADMIN_TOKEN_TTL, "scope": "admin"}
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM), ADMIN_TOKEN_TTL
+
+
+def verify_token(token: str) -> str:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={"require": ["exp", "sub"]})
+    except jwt.PyJWTError:
+        raise HTTPException(
+            status_code=401, detail="Invalid or expired admin token", headers={"WWW-Authenticate": "Bearer"}
+        )
+    if payload.get("scope") != "admin":
+        raise HTTPException(status_code=403, detail="Token is not valid for admin access")
+    return payload["sub"]
+
+
+def issue_upload_token(upload_id: str, ttl: int) -> str:
+    """A token that lets whoever holds it send the file for one direct upload."""
+    now = int(time.time())
+    payload = {"sub": upload_id, "iat": now, "exp": now + ttl, "scope": "upload"}
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def verify_upload_token(token: str, upload_id: str) -> None:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={"require": ["exp", "sub"]})
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=403, detail="Invalid or expired upload URL")
+    if payload.get("scope") != "upload" or payload["sub"] != upload_id:
+        raise HTTPException(status_code=403, detail="Invalid or expired upload URL")
+
+
+basic_security = HTTPBasic(auto_error=False)
+bearer_security = HTTPBearer(auto_error=False)
+
+
+def verify_admin(
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(bearer_security),
+    basic: Optional[HTTPBasicCredentials] = Depends(basic_security),
+) -> str:
+    """Accepts a token from /api/admin/login, or Basic credentials from older clients."""
+    if bearer is not None:
+        with span("auth.verify_admin", scheme="bearer"):
+            return verify_token(bearer.credentials)
+    if basic is not None:
+        with span("auth.verify_admin", scheme="basic"):
+            return check_credentials(basic)
+    raise HTTPException(
+        status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Basic"}
+    )
+
+
+def verify_admin_credentials(credentials: HTTPBasicCredentials = Depends(HTTPBasic())) -> str:
+    """Basic credentials only, for the login endpoint."""
+    return check_credentials(credentials)
+
+
+if __name__ == "__main__":
+    # Hash a password for ADMIN_PASSWORD_HASH: python auth.py
+    import getpass
+
+    print(password_context.hash(getpass.getpass("Admin password: ")))
@@ -0,0 +1,225 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Duplicate key, expected when journal entries are replayed after a crash
+DUPLICATE_KEY = 11000
+
+
+class Journal:
+    """Append-only JSON lines file holding documents that haven't been written to Mongo yet.
+
+    All access goes through one lock, so the file is only truncated when every
+    line in it has been flushed. Each process holds an exclusive flock on its
+    file, so several workers configured with the same path never share one.
+    """
+
+    def __init__(self, path: Path, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._written = 0
+        self._flushed = 0
+        self._file = None
+        # The file this process ended up locking, path or path.1, path.2, ...
+        self.active_path: Optional[Path] = None
+
+    def _open_unlocked(self):
+        # Locks die with their process, so a replacement worker takes over the
+        # first journal nobody holds and replays what its predecessor left
+        for index in itertools.count():
+            candidate = self.path if index == 0 else self.path.with_name(f"{self.path.name}.{index}")
+            f = open(candidate, "a+", encoding="utf-8")
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            self.active_path = candidate
+            return f
+
+    def replay(self) -> List[str]:
+        """Open the journal for appending and return the lines left by the previous run."""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self._open_unlocked()
+            self._file.seek(0)
+            lines = [line.rstrip("\n") for line in self._file if line.strip()]
+            self._written = len(lines)
+            self._flushed = 0
+            return lines
+
+    def append(self, line: str) -> None:
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._written += 1
+
+    def mark_flushed(self, count: int) -> None:
+        with self._lock:
+            self._flushed += count
+            if self._flushed >= self._written:
+                self._file.truncate(0)
+                self._file.seek(0)
+                self._written = self._flushed = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class BatchWriter:
+    """Buffers documents in memory and writes them with insert_many.
+
+    A batch is flushed when it reaches max_batch documents or when the oldest
+    queued document has waited max_delay seconds. With a journal, enqueue only
+    returns once the document is on disk, and unflushed documents are replayed
+    on the next start.
+    """
+
+    def __init__(
+        self,
+        collection,
+        max_batch: int = 100,
+        max_delay: float = 0.5,
+        journal: Optional[Journal] = None,
+        decode: Callable[[str], Dict[str, Any]] = json.loads,
+    ):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.journal = journal
+        self.decode = decode
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: List[Dict[str, Any]] = []
+        # Metrics
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    async def start(self) -> None:
+        # Bind the queue to the running loop
+        self._queue = asyncio.Queue()
+        if self.journal is not None:
+            skipped = 0
+            for line in await run_in_threadpool(self.journal.replay):
+                try:
+                    self._queue.put_nowait(self.decode(line))
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    logger.warning("Skipping unreadable journal line in %s", self.journal.path)
+                    skipped += 1
+            if skipped:
+                await run_in_threadpool(self.journal.mark_flushed, skipped)
+            if self._queue.qsize():
+                logger.info("Replaying %d journaled documents into %s", self._queue.qsize(), self.collection.name)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Drain whatever is still queued before shutting down
+        if self._task is not None:
+            # Before 3.12, wait_for drops a cancellation that races with queue.get()
+            # returning, so keep cancelling until the task has really finished
+            while not self._task.done():
+                self._task.cancel()
+                await asyncio.wait({self._task}, timeout=0.1)
+            self._task = None
+        # The batch that was being written when we cancelled is retried first,
+        # anything it already inserted is skipped as a duplicate
+        batch = self._inflight
+        while batch or not self._queue.empty():
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if not await self._flush(batch):
+                logger.error("Shutting down with %d unwritten documents left in the journal", len(batch) + self._queue.qsize())
+                break
+            batch = []
+        self._inflight = []
+        if self.journal is not None:
+            await run_in_threadpool(self.journal.close)
+
+    async def enqueue(self, doc: Dict[str, Any], journal_line: Optional[str] = None) -> None:
+        """Queue a document, journal_line is its serialized form for the journal."""
+        if self.journal is not None:
+            await run_in_threadpool(self.journal.append, journal_line or json.dumps(doc))
+        self._queue.put_nowait(doc)
+        self.enqueued += 1
+
+    async def _collect_batch(self) -> None:
+        # Collected straight into _inflight so nothing is dropped if stop() cancels us mid-batch
+        self._inflight.append(await self._queue.get())
+        deadline = time.monotonic() + self.max_delay
+        while len(self._inflight) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                self._inflight.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        started = time.perf_counter()
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+            if errors:
+                logger.error("Failed to write %d of %d documents to %s", len(errors), len(batch), self.collection.name)
+                self.failures += 1
+                return False
+        except PyMongoError:
+            logger.exception("Batch write to %s failed", self.collection.name)
+            self.failures += 1
+            return False
+
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.flushed += len(batch)
+        self.last_flush_seconds = elapsed
+        self.total_flush_seconds += elapsed
+        if self.journal is not None:
+            await run_in_threadpool(self.journal.mark_flushed, len(batch))
+        return True
+
+    async def _run(self) -> None:
+        retry_delay = self.max_delay
+        while True:
+            await self._collect_batch()
+            while not await self._flush(self._inflight):
+                # Keep the batch and back off until Mongo is reachable again
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+            self._inflight = []
+            retry_delay = self.max_delay
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() + len(self._inflight),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 3),
+            "avg_flush_ms": round(self.total_flush_seconds / self.batches * 1000, 3) if self.batches else 0.0,
+        }
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput of the API routes under concurrency.
+
+The app runs in-process (httpx ASGITransport, with the app lifespan
+included) against mongomock-motor by default, or a local mongod with
+--mongo-url. The database is seeded with --pdfs PDFs, --schedules class
+schedules and --contacts contact messages, then each route gets --requests
+requests from --concurrency concurrent clients.
+
+Results are written as JSON so runs can be compared between commits:
+    python -m benchmarks.api --output before.json
+    git checkout other-branch
+    python -m benchmarks.api --output after.json --compare before.json
+
+Run from the backend directory. Needs httpx, and mongomock-motor unless
+--mongo-url is given.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+EXAM_TYPES = ("SSC", "UPSC", "Banking", "Railway", "State PSC")
+SUBJECTS = ("Reasoning", "Quantitative Aptitude", "English", "General Awareness", "Polity")
+TOPICS = ("syllogism", "blood relations", "percentages", "time and work", "reading comprehension", "constitution")
+
+ROUTES = (
+    "root",
+    "pdfs",
+    "pdfs_page",
+    "pdfs_exam",
+    "pdfs_search",
+    "download",
+    "schedule",
+    "contact",
+    "admin_contacts",
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", type=int, default=1000)
+    parser.add_argument("--schedules", type=int, default=100)
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--pdf-kb", type=int, default=256, help="size of the file behind every seeded PDF")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per route")
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=list(ROUTES))
+    parser.add_argument("--mongo-url", help="use this mongod instead of mongomock-motor, the database is dropped afterwards")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="print the change against a previous results file")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir: Path) -> None:
+    # server.py reads its configuration at import time
+    os.environ["DB_NAME"] = f"benchmark_{uuid.uuid4().hex[:8]}"
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://localhost:27017"
+    os.environ["SEARCH_INDEX_PATH"] = ""
+    os.environ["CONTACT_JOURNAL_PATH"] = str(workdir / "contact_journal.jsonl")
+    # Every benchmark client shares one address, so rate limits would measure 429s
+    os.environ["RATE_LIMITS"] = json.dumps({
+        "POST /api/contact": "",
+        "GET /api/pdfs/download/{pdf_id}": "",
+        "GET /api/pdfs/search": "",
+    })
+    os.environ.setdefault("JWT_SECRET", "benchmark-" + "0" * 32)
+    if not args.mongo_url:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed(server, args, workdir: Path, rng: random.Random) -> List[str]:
+    """Insert the benchmark data straight into Mongo, returns the PDF ids."""
+    content = b"%PDF-1.4\n" + os.urandom(args.pdf_kb * 1024)
+    digest = hashlib.sha256(content).hexdigest()
+    pdf_path = workdir / f"{digest}.pdf"
+    pdf_path.write_bytes(content)
+
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    pdfs = []
+    for i in range(args.pdfs):
+        topic = rng.choice(TOPICS)
+        pdf = server.PDFDocument(
+            title=f"{rng.choice(SUBJECTS)} notes {i}: {topic}",
+            exam_type=EXAM_TYPES[i % len(EXAM_TYPES)],
+            subject=rng.choice(SUBJECTS),
+            batch=f"{2023 + i % 3} Morning",
+            filename=f"notes-{i}.pdf",
+            file_path=str(pdf_path),
+            upload_date=start + timedelta(minutes=i),
+            description=f"Practice questions on {topic}",
+            file_size=len(content),
+            sha256=digest,
+            page_count=12,
+            processing_status="done",
+        ).model_dump()
+        pdf["extracted_text"] = f"{topic} " * 50
+        pdfs.append(pdf)
+    if pdfs:
+        await server.db.pdf_documents.insert_many(pdfs)
+
+    schedules = [
+        server.ClassSchedule(
+            exam_type=EXAM_TYPES[i % len(EXAM_TYPES)],
+            subject=rng.choice(SUBJECTS),
+            day_of_week=("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday")[i % 6],
+            time=f"{8 + i % 10}:00",
+            is_online=bool(i % 2),
+            meeting_link="https://meet.example.com/abc-defg-hij" if i % 2 else None,
+        ).model_dump()
+        for i in range(args.schedules)
+    ]
+    if schedules:
+        await server.db.class_schedules.insert_many(schedules)
+
+    contacts = [
+        server.ContactMessage(
+            name=f"Student {i}",
+            phone=f"98{i:08d}",
+            email=f"student{i}@example.com",
+            course_interested=rng.choice(EXAM_TYPES),
+            message="Please share the batch timings",
+        ).model_dump()
+        for i in range(args.contacts)
+    ]
+    if contacts:
+        await server.db.contact_messages.insert_many(contacts)
+    return [pdf["id"] for pdf in pdfs]
+
+
+def build_requests(pdf_ids: List[str], token: str, rng: random.Random) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    """Route name -> function returning the kwargs for one httpx request."""
+    admin = {"Authorization": f"Bearer {token}"}
+
+    def contact():
+        i = rng.randrange(1_000_000)
+        return {"method": "POST", "url": "/api/contact", "json": {
+            "name": f"Visitor {i}", "phone": "9800000000", "email": f"visitor{i}@example.com",
+            "course_interested": "SSC", "message": "Benchmark enquiry",
+        }}
+
+    return {
+        "root": lambda: {"method": "GET", "url": "/api/"},
+        "pdfs": lambda: {"method": "GET", "url": "/api/pdfs"},
+        "pdfs_page": lambda: {"method": "GET", "url": "/api/pdfs", "params": {"limit": 20}},
+        "pdfs_exam": lambda: {"method": "GET", "url": f"/api/pdfs/exam/{rng.choice(EXAM_TYPES)}"},
+        "pdfs_search": lambda: {"method": "GET", "url": "/api/pdfs/search", "params": {"q": rng.choice(TOPICS)}},
+        "download": lambda: {"method": "GET", "url": f"/api/pdfs/download/{rng.choice(pdf_ids)}"},
+        "schedule": lambda: {"method": "GET", "url": "/api/schedule"},
+        "contact": contact,
+        "admin_contacts": lambda: {"method": "GET", "url": "/api/admin/contacts", "headers": admin},
+    }
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    # Nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def run_route(client, make_request, total: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    response_bytes = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors, response_bytes
+        while remaining > 0:
+            remaining -= 1
+            kwargs = make_request()
+            started = time.perf_counter()
+            response = await client.request(**kwargs)
+            latencies.append(time.perf_counter() - started)
+            response_bytes += len(response.content)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "throughput_rps": round(len(ms) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(ms[-1], 3) if ms else 0.0,
+        "avg_response_bytes": round(response_bytes / len(ms)) if ms else 0,
+    }
+
+
+async def benchmark(args, workdir: Path) -> Dict[str, Any]:
+    import httpx
+
+    import server
+
+    rng = random.Random(args.seed)
+    pdf_ids = await seed(server, args, workdir, rng)
+
+    transport = httpx.ASGITransport(app=server.app)
+    results = {}
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            # Don't race the background reconcile, the search route needs a full index
+            await server.search_index.reconcile(server.db)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                login = await client.post("/api/admin/login", auth=("admin", os.environ.get("ADMIN_PASSWORD", "admin123")))
+                login.raise_for_status()
+                makers = build_requests(pdf_ids, login.json()["access_token"], rng)
+                for name in args.routes:
+                    if name == "download" and not pdf_ids:
+                        continue
+                    await run_route(client, makers[name], args.warmup, min(args.concurrency, max(1, args.warmup)))
+                    results[name] = await run_route(client, makers[name], args.requests, args.concurrency)
+                    print_row(name, results[name])
+    finally:
+        if args.mongo_url:
+            await server.client.drop_database(os.environ["DB_NAME"])
+    return results
+
+
+def print_row(name: str, result: Dict[str, Any]) -> None:
+    print(
+        f"{name:>15} {result['throughput_rps']:>9.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+        f" {result['p99_ms']:>9.2f} {result['errors']:>7}"
+    )
+
+
+def print_comparison(results: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange against {baseline_path} ({baseline['meta'].get('commit')}):")
+    print(f"{'route':>15} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, result in results["routes"].items():
+        before = baseline["routes"].get(name)
+        if before is None:
+            continue
+
+        def change(key):
+            return f"{(result[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else "n/a"
+
+        print(f"{name:>15} {change('throughput_rps'):>9} {change('p50_ms'):>9} {change('p95_ms'):>9} {change('p99_ms'):>9}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix="api-benchmark-") as tmp:
+        workdir = Path(tmp)
+        configure_environment(args, workdir)
+        print(f"{'route':>15} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        routes = asyncio.run(benchmark(args, workdir))
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongo": "mongod" if args.mongo_url else "mongomock-motor",
+            "seed": {"pdfs": args.pdfs, "schedules": args.schedules, "contacts": args.contacts, "pdf_kb": args.pdf_kb},
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "routes": routes,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire and CPU per request for compressed list responses.
+
+"per request" compresses the serialized list on every request, which is what
+CompressionMiddleware does for uncached routes. "cached" is the response
+cache path: the compressed body is built once per change and later requests
+only pay for the cache lookup.
+
+Run from the backend directory:
+    python -m benchmarks.compression [--sizes 100 1000 10000]
+"""
+
+import argparse
+import asyncio
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from benchmarks.serialization import make_docs, raw_path
+from cache import MemoryBackend, ResponseCache
+from compression import SUPPORTED_ENCODINGS, compress
+
+
+def cpu_per_call(fn, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) / repeat
+
+
+def make_request(encoding: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/pdfs",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", encoding.encode())],
+    })
+
+
+def cached_cpu_per_request(body: bytes, encoding: str, repeat: int) -> float:
+    cache = ResponseCache(MemoryBackend(16, 3600))
+    request = make_request(encoding)
+
+    async def build():
+        return Response(body, media_type="application/json")
+
+    async def run():
+        await cache.get_or_build("pdfs", request, build)  # warm: serialize and compress once
+        started = time.process_time()
+        for _ in range(repeat):
+            await cache.get_or_build("pdfs", request, build)
+        return (time.process_time() - started) / repeat
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'docs':>8} {'encoding':>8} {'bytes':>10} {'ratio':>6} {'per request ms':>15} {'cached ms':>10}")
+    for size in args.sizes:
+        body = raw_path(make_docs(size))
+        print(f"{size:>8} {'identity':>8} {len(body):>10} {1:>6.1f} {'-':>15} {'-':>10}")
+        for encoding in SUPPORTED_ENCODINGS:
+            compressed = compress(body, encoding)
+            per_request = cpu_per_call(lambda: compress(body, encoding), args.repeat)
+            cached = cached_cpu_per_request(body, encoding, args.repeat)
+            print(
+                f"{size:>8} {encoding:>8} {len(compressed):>10} {len(body) / len(compressed):>6.1f}"
+                f" {per_request * 1000:>15.2f} {cached * 1000:>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Compare list endpoint serialization paths.
+
+"models" is the old path: a PDFDocument per row, then FastAPI validating the
+list against response_model and encoding it with json.dumps. "raw" is what
+get_all_pdfs does now: model_projection rows encoded directly with orjson.
+
+Run from the backend directory:
+    python -m benchmarks.serialization [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# server.py reads these at import time, the client never connects here
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from serialization import fill_defaults, json_response, model_projection  # noqa: E402
+from server import PDFDocument  # noqa: E402
+
+
+def make_docs(count: int) -> List[dict]:
+    # Shaped like motor results: naive UTC datetimes and an _id the projection drops
+    start = datetime(2024, 1, 1)
+    fields = set(model_projection(PDFDocument)) - {"_id"}
+    docs = []
+    for i in range(count):
+        doc = {
+            "id": str(uuid.uuid4()),
+            "title": f"Reasoning practice set {i}",
+            "exam_type": ("SSC", "UPSC", "Banking", "Railway")[i % 4],
+            "subject": "Reasoning",
+            "batch": "2024 Morning",
+            "filename": f"set-{i}.pdf",
+            "file_path": f"/app/backend/uploads/ab/cd/{i:064x}.pdf",
+            "upload_date": start + timedelta(minutes=i),
+            "description": "Syllogism and blood relations",
+            "file_size": 120_000 + i,
+            "sha256": f"{i:064x}",
+        }
+        docs.append({k: v for k, v in doc.items() if k in fields})
+    return docs
+
+
+adapter = TypeAdapter(List[PDFDocument])
+
+
+def models_path(docs: List[dict]) -> bytes:
+    models = [PDFDocument(**doc) for doc in docs]
+    validated = adapter.validate_python(models)
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+
+def raw_path(docs: List[dict]) -> bytes:
+    return json_response(fill_defaults(PDFDocument, docs)).body
+
+
+def measure(fn, docs: List[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        rows = [dict(doc) for doc in docs]
+        started = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'docs':>8} {'models ms':>10} {'raw ms':>8} {'speedup':>8}")
+    for size in args.sizes:
+        docs = make_docs(size)
+        assert json.loads(models_path([dict(d) for d in docs])) == json.loads(raw_path([dict(d) for d in docs]))
+        old = measure(models_path, docs, args.repeat)
+        new = measure(raw_path, docs, args.repeat)
+        print(f"{size:>8} {old * 1000:>10.1f} {new * 1000:>8.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
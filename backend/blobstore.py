@@ -0,0 +1,376 @@
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
+
+from downloads import build_download_info, build_file_response, content_disposition
+from filestore import FileStore
+from metrics import pdf_bytes_served
+
+logger = logging.getLogger(__name__)
+
+# "local" keeps files under UPLOAD_DIR, "s3" in an S3-compatible bucket (AWS, MinIO, ...)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local').lower()
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', '')
+# e.g. http://localhost:9000 for MinIO, empty for AWS
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+# Lifetime of the URLs downloads are redirected to
+S3_PRESIGN_TTL = int(os.environ.get('S3_PRESIGN_TTL', '300'))
+# Files larger than the threshold are uploaded in parts of S3_PART_SIZE, S3_UPLOAD_CONCURRENCY at a time
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', '8')) * 1024 * 1024
+S3_PART_SIZE = int(os.environ.get('S3_PART_SIZE_MB', '8')) * 1024 * 1024
+S3_UPLOAD_CONCURRENCY = int(os.environ.get('S3_UPLOAD_CONCURRENCY', '4'))
+# Where uploads are spooled while they are hashed, before they go to the bucket
+S3_SPOOL_DIR = os.environ.get('S3_SPOOL_DIR') or tempfile.gettempdir()
+
+S3_SCHEME = "s3://"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_name(sha256: str) -> str:
+    # Content-addressed layout sharded on the first two bytes: ab/cd/abcd...pdf
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.pdf"
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _size_and_hash(path: Path) -> Optional[Tuple[int, str]]:
+    try:
+        return path.stat().st_size, hash_file(path)
+    except FileNotFoundError:
+        return None
+
+
+def place_file(tmp_path: Path, final_path: Path) -> None:
+    if final_path.exists():
+        # Identical content is already stored, drop the new copy
+        tmp_path.unlink()
+        return
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, final_path)
+
+
+class LocalBlobStore:
+    """Files under root on a local or network volume, served by this process or the reverse proxy.
+
+    Locations are absolute paths, so records written before the store existed
+    keep working.
+    """
+
+    kind = "local"
+
+    def __init__(self, root: Path, files: FileStore):
+        self.root = root
+        self.files = files
+        # Spooled next to the blobs, so placing one is a rename on the same filesystem
+        self.spool_dir = root
+
+    def location(self, name: str) -> str:
+        return str(self.root / name)
+
+    async def put(self, tmp_path: Path, location: str, content_type: str = "application/pdf") -> None:
+        """Move a spooled file into place, keeping the existing file if there is one."""
+        try:
+            await self.files.run(place_file, tmp_path, Path(location))
+        finally:
+            self.files.invalidate(location)
+
+    async def move(self, source: str, location: str) -> None:
+        """Move a stored file to location, dropping it if location already exists."""
+        await self.put(Path(source), location)
+        self.files.invalidate(source)
+
+    async def checksum(self, location: str) -> Optional[Tuple[int, str]]:
+        """Size and SHA-256 of a stored file, None if it is missing."""
+        return await self.files.run(_size_and_hash, Path(location))
+
+    async def delete(self, location: str) -> None:
+        await self.files.unlink(location)
+
+    async def exists(self, location: str) -> bool:
+        return await self.files.exists(location)
+
+    @asynccontextmanager
+    async def readable(self, location: str) -> AsyncIterator[Path]:
+        yield Path(location)
+
+    @asynccontextmanager
+    async def writable(self, location: str) -> AsyncIterator[Path]:
+        """A path to write location at, written in place."""
+        try:
+            yield Path(location)
+        finally:
+            self.files.invalidate(location)
+
+    async def download_info(self, pdf_doc: dict) -> Any:
+        return await build_download_info(pdf_doc, self.files)
+
+    def download_response(self, request: Request, info: Any) -> Response:
+        return build_file_response(request, info, self.root)
+
+    async def file_response(self, location: str, media_type: str, headers: Dict[str, str]) -> Optional[Response]:
+        """Serve a stored file other than a PDF download, None if it is missing."""
+        stat = await self.files.stat(location)
+        if stat is None:
+            return None
+        return FileResponse(path=location, media_type=media_type, headers=headers, stat_result=stat)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "root": str(self.root), **self.files.stats()}
+
+
+class NotInBucket(ValueError):
+    """A location that isn't in the bucket, e.g. a record from before the switch to S3."""
+
+
+@dataclass
+class PresignedDownload:
+    key: str
+    filename: str
+    size: int
+
+
+class S3BlobStore:
+    """Objects in an S3-compatible bucket.
+
+    Locations are s3://bucket/key. Records from before the switch still hold
+    local paths until storage.migrate_to_s3 moves them, those can only be
+    deleted. Downloads are 302 redirects to presigned URLs, so file bytes
+    never pass through the API. Uploads are spooled to
+    S3_SPOOL_DIR while they are hashed and then sent as a multipart upload with
+    parts in parallel. boto3 calls block, they run on the FileStore's threads.
+    """
+
+    kind = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        files: FileStore,
+        prefix: str = S3_PREFIX,
+        client=None,
+        presign_ttl: int = S3_PRESIGN_TTL,
+        spool_dir: str = S3_SPOOL_DIR,
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires the boto3 package") from e
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.files = files
+        self.client = client or boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+        self.presign_ttl = presign_ttl
+        self.spool_dir = Path(spool_dir)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_PART_SIZE,
+            max_concurrency=S3_UPLOAD_CONCURRENCY,
+        )
+        # Metrics
+        self.uploaded = 0
+        self.deduplicated = 0
+        self.redirects = 0
+
+    def location(self, name: str) -> str:
+        return f"{S3_SCHEME}{self.bucket}/{self.prefix}{name}"
+
+    def key(self, location: str) -> str:
+        bucket_prefix = f"{S3_SCHEME}{self.bucket}/"
+        if not location.startswith(bucket_prefix):
+            raise NotInBucket(f"{location} is not in bucket {self.bucket}")
+        return location[len(bucket_prefix):]
+
+    def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _upload(self, path: Path, key: str, content_type: str) -> None:
+        self.client.upload_file(
+            str(path), self.bucket, key, ExtraArgs={"ContentType": content_type}, Config=self.transfer_config
+        )
+
+    async def put(self, tmp_path: Path, location: str, content_type: str = "application/pdf") -> None:
+        """Upload a spooled file unless the key already exists, the spooled file is removed either way."""
+        key = self.key(location)
+        try:
+            if await self.files.run(self._exists, key):
+                self.deduplicated += 1
+            else:
+                await self.files.run(self._upload, tmp_path, key, content_type)
+                self.uploaded += 1
+        finally:
+            await self.files.unlink(tmp_path)
+
+    def _move(self, source_key: str, key: str) -> None:
+        # A server side copy, the bytes stay in the bucket
+        if self._exists(key):
+            self.deduplicated += 1
+        else:
+            self.client.copy({"Bucket": self.bucket, "Key": source_key}, self.bucket, key, Config=self.transfer_config)
+        self.client.delete_object(Bucket=self.bucket, Key=source_key)
+
+    async def move(self, source: str, location: str) -> None:
+        """Move an object to location, dropping it if location already exists."""
+        await self.files.run(self._move, self.key(source), self.key(location))
+
+    def _checksum(self, key: str) -> Optional[Tuple[int, str]]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key, ChecksumMode="ENABLED")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        size = head["ContentLength"]
+        # Checked by S3 when the upload sent one, a multipart checksum ("...-3") isn't the file hash
+        checksum = head.get("ChecksumSHA256")
+        if checksum and "-" not in checksum:
+            try:
+                return size, base64.b64decode(checksum).hex()
+            except binascii.Error:
+                pass
+        # Stores without checksum support, read the object back
+        hasher = hashlib.sha256()
+        body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        for chunk in body.iter_chunks(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+        return size, hasher.hexdigest()
+
+    async def checksum(self, location: str) -> Optional[Tuple[int, str]]:
+        """Size and SHA-256 of an object, None if it is missing."""
+        return await self.files.run(self._checksum, self.key(location))
+
+    def presigned_post(self, location: str, size: int, sha256: str, expires_in: int) -> Dict[str, Any]:
+        """Form fields for a browser to POST exactly size bytes with this hash straight to the bucket."""
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        fields = {
+            "Content-Type": "application/pdf",
+            "x-amz-checksum-algorithm": "SHA256",
+            "x-amz-checksum-sha256": checksum,
+        }
+        conditions = [["content-length-range", size, size], *({name: value} for name, value in fields.items())]
+        return self.client.generate_presigned_post(
+            self.bucket, self.key(location), Fields=fields, Conditions=conditions, ExpiresIn=expires_in
+        )
+
+    async def upload(self, path: Path, location: str, content_type: str = "application/pdf") -> None:
+        """Upload a local file to location, leaving the file in place."""
+        await self.files.run(self._upload, path, self.key(location), content_type)
+        self.uploaded += 1
+
+    async def delete(self, location: str) -> None:
+        if not location.startswith(S3_SCHEME):
+            # Left over from local storage
+            await self.files.unlink(location)
+            return
+        await self.files.run(self.client.delete_object, Bucket=self.bucket, Key=self.key(location))
+
+    async def exists(self, location: str) -> bool:
+        return await self.files.run(self._exists, self.key(location))
+
+    def _scratch_path(self, location: str) -> Path:
+        return self.spool_dir / f".{uuid.uuid4()}{os.path.splitext(location)[1]}"
+
+    @asynccontextmanager
+    async def readable(self, location: str) -> AsyncIterator[Path]:
+        """Download location to a scratch file for the duration of the block."""
+        path = self._scratch_path(location)
+        try:
+            await self.files.run(self.client.download_file, self.bucket, self.key(location), str(path))
+            yield path
+        finally:
+            await self.files.unlink(path)
+
+    @asynccontextmanager
+    async def writable(self, location: str) -> AsyncIterator[Path]:
+        """A scratch path to write location at, uploaded if the block wrote it."""
+        path = self._scratch_path(location)
+        try:
+            yield path
+        except BaseException:
+            await self.files.unlink(path)
+            raise
+        # Not through the stat cache, scratch paths are never looked up twice
+        if await self.files.run(path.exists):
+            content_type = "image/jpeg" if location.endswith(".jpg") else "application/pdf"
+            await self.put(path, location, content_type)
+
+    def presigned_url(self, key: str, filename: Optional[str] = None, media_type: Optional[str] = None) -> str:
+        # Signed locally, no request to the bucket
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename is not None:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        if media_type is not None:
+            params["ResponseContentType"] = media_type
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.presign_ttl)
+
+    async def download_info(self, pdf_doc: dict) -> PresignedDownload:
+        # Trusts the record rather than asking the bucket, a missing object is a 404 from S3
+        if pdf_doc.get("optimized_path"):
+            return PresignedDownload(self.key(pdf_doc["optimized_path"]), pdf_doc["filename"], pdf_doc.get("optimized_size") or 0)
+        return PresignedDownload(self.key(pdf_doc["file_path"]), pdf_doc["filename"], pdf_doc.get("file_size") or 0)
+
+    def download_response(self, request: Request, info: PresignedDownload) -> Response:
+        self.redirects += 1
+        pdf_bytes_served.inc("presigned", amount=info.size)
+        # Not cached, the URL stops working after presign_ttl
+        return RedirectResponse(
+            self.presigned_url(info.key, info.filename, "application/pdf"),
+            status_code=302,
+            headers={"Cache-Control": "no-store"},
+        )
+
+    async def file_response(self, location: str, media_type: str, headers: Dict[str, str]) -> Optional[Response]:
+        self.redirects += 1
+        return RedirectResponse(
+            self.presigned_url(self.key(location), media_type=media_type),
+            status_code=302,
+            headers={"Cache-Control": "no-store"},
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.kind,
+            "bucket": self.bucket,
+            "prefix": self.prefix,
+            "uploaded": self.uploaded,
+            "deduplicated": self.deduplicated,
+            "redirects": self.redirects,
+            **self.files.stats(),
+        }
+
+
+def create_blob_store(root: Path, files: FileStore):
+    if STORAGE_BACKEND == "s3":
+        return S3BlobStore(S3_BUCKET, files)
+    return LocalBlobStore(root, files)
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from compression import MIN_COMPRESS_SIZE, add_vary, choose_encoding, compress
+from shared_state import STATE_BACKEND, redis_client
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Public list responses are cached as serialized bytes for this long
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '60'))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '512'))
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', STATE_BACKEND).lower()
+
+
+class LRUCache:
+    """A small in-process LRU cache with an optional per-entry TTL in seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class MemoryBackend:
+    """Response cache storage local to this process."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = LRUCache(maxsize, ttl)
+        self._versions: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        self._entries.set(key, value)
+
+    async def version(self, namespace: str) -> int:
+        return self._versions.get(namespace, 0)
+
+    async def bump_version(self, namespace: str) -> None:
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Response cache storage shared between processes through a Redis-compatible server.
+
+    Any client with the redis.asyncio get/set/incr interface works, so tests
+    and local setups can pass a stand-in such as fakeredis.
+    """
+
+    def __init__(self, ttl: float, client=None, prefix: str = "respcache"):
+        self.client = client if client is not None else redis_client("RESPONSE_CACHE_BACKEND=redis")
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(f"{self.prefix}:{key}")
+
+    async def set(self, key: str, value: bytes) -> None:
+        await self.client.set(f"{self.prefix}:{key}", value, ex=max(1, int(self.ttl)))
+
+    async def version(self, namespace: str) -> int:
+        return int(await self.client.get(f"{self.prefix}:version:{namespace}") or 0)
+
+    async def bump_version(self, namespace: str) -> None:
+        await self.client.incr(f"{self.prefix}:version:{namespace}")
+
+    def __len__(self) -> int:
+        return 0
+
+
+# Response headers that are part of the cached payload
+CACHED_HEADERS = ("x-next-cursor",)
+
+
+class ResponseCache:
+    """Caches serialized JSON responses by route and query string.
+
+    Keys include a per-namespace version, so invalidating a namespace is a
+    single version bump and stale entries simply age out of the backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.compressions = 0
+
+    @staticmethod
+    def request_key(request: Request) -> str:
+        return f"{request.url.path}?{urlencode(sorted(request.query_params.multi_items()))}"
+
+    @staticmethod
+    def _encode(response: Response) -> bytes:
+        headers = {k: v for k, v in response.headers.items() if k in CACHED_HEADERS}
+        return json.dumps(headers).encode() + b"\n" + response.body
+
+    @staticmethod
+    def _decode(payload: bytes, encoding: Optional[str] = None) -> Response:
+        headers, _, body = payload.partition(b"\n")
+        response = Response(content=body, media_type="application/json", headers=json.loads(headers))
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        add_vary(response.headers)
+        return response
+
+    async def _store(self, key: str, payload: bytes) -> None:
+        try:
+            await self.backend.set(key, payload)
+        except Exception:
+            logger.exception("Response cache store failed")
+            self.errors += 1
+
+    async def _compressed(self, key: str, payload: bytes, encoding: Optional[str]) -> Response:
+        """Response for a cached payload, compressing it once and caching that too."""
+        headers, _, body = payload.partition(b"\n")
+        if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+            return self._decode(payload)
+        compressed = headers + b"\n" + await run_in_threadpool(compress, body, encoding)
+        self.compressions += 1
+        await self._store(f"{key}:{encoding}", compressed)
+        return self._decode(compressed, encoding)
+
+    async def get_or_build(
+        self,
+        namespace: str,
+        request: Request,
+        build: Callable[[], Awaitable[Response]],
+    ) -> Response:
+        # Compressed variants are cached next to the plain payload, so a hot
+        # list is serialized and compressed once per change
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        try:
+            with span("cache.lookup", namespace=namespace):
+                version = await self.backend.version(namespace)
+                key = f"{namespace}:{version}:{self.request_key(request)}"
+                payload = None
+                if encoding is not None:
+                    payload = await self.backend.get(f"{key}:{encoding}")
+                if payload is not None:
+                    response = self._decode(payload, encoding)
+                else:
+                    payload = await self.backend.get(key)
+                    response = await self._compressed(key, payload, encoding) if payload is not None else None
+        except Exception:
+            # A cache outage must not take the read endpoints down with it
+            logger.exception("Response cache lookup failed")
+            self.errors += 1
+            return await build()
+
+        if response is not None:
+            self.hits += 1
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+        self.misses += 1
+        response = await build()
+        if response.status_code == 200:
+            payload = self._encode(response)
+            await self._store(key, payload)
+            response = await self._compressed(key, payload, encoding)
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    async def invalidate(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            try:
+                await self.backend.bump_version(namespace)
+            except Exception:
+                logger.exception("Response cache invalidation failed for %s", namespace)
+                self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "compressions": self.compressions,
+            "entries": len(self.backend),
+        }
+
+
+def create_response_cache() -> ResponseCache:
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return ResponseCache(RedisBackend(RESPONSE_CACHE_TTL))
+    return ResponseCache(MemoryBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL))
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Resume tokens are stored under this name, so a restarted process continues
+# where the previous one on the same host stopped
+CHANGE_FEED_NAME = os.environ.get('CHANGE_FEED_NAME') or socket.gethostname()
+# "auto" watches change streams when the deployment has them (replica sets and
+# sharded clusters) and polls version counters otherwise, "poll" always polls
+CHANGE_FEED_MODE = os.environ.get('CHANGE_FEED_MODE', 'auto').lower()
+# How long a getMore on the change stream waits, changes that arrive together are applied together after it
+CHANGE_FEED_MAX_AWAIT_MS = int(os.environ.get('CHANGE_FEED_MAX_AWAIT_MS', '500'))
+CHANGE_FEED_POLL_INTERVAL = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', '2'))
+# Resume tokens are saved at most this often
+CHANGE_FEED_TOKEN_INTERVAL = float(os.environ.get('CHANGE_FEED_TOKEN_INTERVAL', '10'))
+# Changed ids kept on each version counter, pollers further behind than this refresh everything
+CHANGE_FEED_RECENT = int(os.environ.get('CHANGE_FEED_RECENT', '100'))
+CHANGE_FEED_RETRY_DELAY = float(os.environ.get('CHANGE_FEED_RETRY_DELAY', '5'))
+
+# Servers without change streams: not a replica set, unknown $changeStream stage, command not supported
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324, 115}
+# The saved token is older than the oplog or doesn't belong to this deployment
+RESUME_TOKEN_LOST = {286, 260, 280}
+
+# A handler gets the ids of the changed documents, or None when they aren't
+# known (a gap in the feed) and everything has to be refreshed
+Handler = Callable[[Optional[Set[str]]], Awaitable[None]]
+
+
+class ChangeFeed:
+    """Keeps this process's caches in line with writes made through any API node.
+
+    Watches the collections in handlers with a change stream and calls each
+    handler with the ids that changed. Without change streams it falls back
+    to polling a version counter per collection, which writers bump with
+    publish(). The resume token is saved in change_feed_state, so a restart
+    replays what happened while the process was down.
+
+    Delete events only carry the Mongo _id, so the feed keeps a map from _id
+    to API id for the watched collections and applies deletes by id too.
+    """
+
+    def __init__(self, db, handlers: Dict[str, Handler], name: str = CHANGE_FEED_NAME, mode: str = CHANGE_FEED_MODE):
+        self.db = db
+        self.handlers = handlers
+        self.name = name
+        self.mode = mode
+        # Identifies this process in the version counters, so it skips its own changes
+        self.node = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+        self._token: Optional[Dict[str, Any]] = None
+        self._saved_token: Optional[Dict[str, Any]] = None
+        self._last_save = 0.0
+        # collection -> Mongo _id -> API id, to tell handlers which document a delete removed
+        self._ids: Dict[str, Dict[Any, str]] = {}
+        self.source = "starting"
+        self.events = 0
+        self.batches = 0
+        self.full_refreshes = 0
+        self.errors = 0
+
+    # Writers
+
+    async def publish(self, collection: str, ids: Optional[Iterable[str]] = None) -> None:
+        """Record a write for nodes that poll. Call it after changing documents in collection."""
+        entry = {"node": self.node, "ids": list(ids) if ids is not None else None}
+        try:
+            await self.db.change_versions.update_one(
+                {"_id": collection},
+                {"$inc": {"version": 1}, "$push": {"recent": {"$each": [entry], "$slice": -CHANGE_FEED_RECENT}}},
+                upsert=True
+            )
+        except PyMongoError:
+            # The write itself went through, other nodes catch up when their caches expire
+            logger.exception("Publishing a change to %s failed", collection)
+            self.errors += 1
+
+    # Applying changes
+
+    async def _apply(self, changed: Dict[str, Optional[Set[str]]]) -> None:
+        for collection, ids in changed.items():
+            if ids is None:
+                self.full_refreshes += 1
+            try:
+                await self.handlers[collection](ids)
+            except Exception:
+                logger.exception("Applying changes to %s failed", collection)
+                self.errors += 1
+        self.batches += 1
+
+    async def _refresh_everything(self) -> None:
+        await self._apply({collection: None for collection in self.handlers})
+
+    # Change streams
+
+    async def _load_token(self) -> None:
+        state = await self.db.change_feed_state.find_one({"_id": self.name})
+        self._token = self._saved_token = state.get("resume_token") if state else None
+
+    async def _save_token(self, force: bool = False) -> None:
+        loop = asyncio.get_running_loop()
+        if self._token is None or self._token == self._saved_token:
+            return
+        if not force and loop.time() - self._last_save < CHANGE_FEED_TOKEN_INTERVAL:
+            return
+        await self.db.change_feed_state.update_one(
+            {"_id": self.name},
+            {"$set": {"resume_token": self._token, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self._saved_token = self._token
+        self._last_save = loop.time()
+
+    async def _load_ids(self) -> None:
+        ids: Dict[str, Dict[Any, str]] = {}
+        for collection in self.handlers:
+            ids[collection] = {
+                doc["_id"]: doc["id"]
+                async for doc in self.db[collection].find({}, {"_id": 1, "id": 1})
+                if "id" in doc
+            }
+        self._ids = ids
+
+    def _changed_id(self, change: Dict[str, Any]) -> Optional[str]:
+        ids = self._ids.setdefault(change["ns"]["coll"], {})
+        key = change["documentKey"]["_id"]
+        if change["operationType"] == "delete":
+            return ids.pop(key, None)
+        doc_id = (change.get("fullDocument") or {}).get("id")
+        if doc_id is None:
+            # Deleted again before the lookup
+            return ids.get(key)
+        ids[key] = doc_id
+        return doc_id
+
+    def _pipeline(self) -> List[Dict[str, Any]]:
+        return [
+            {"$match": {
+                "ns.coll": {"$in": list(self.handlers)},
+                "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+            }},
+            # Only the ids are needed, handlers read what they need themselves
+            {"$project": {"ns": 1, "operationType": 1, "documentKey": 1, "fullDocument.id": 1}},
+        ]
+
+    async def _watch(self) -> None:
+        changed: Dict[str, Optional[Set[str]]] = {}
+        async with self.db.watch(
+            self._pipeline(),
+            full_document="updateLookup",
+            resume_after=self._token,
+            max_await_time_ms=CHANGE_FEED_MAX_AWAIT_MS,
+        ) as stream:
+            self.source = "change_stream"
+            while True:
+                change = await stream.try_next()
+                if change is not None:
+                    self.events += 1
+                    collection = change["ns"]["coll"]
+                    doc_id = self._changed_id(change)
+                    if doc_id is None:
+                        # A document this process never saw, e.g. inserted before the stream opened
+                        changed[collection] = None
+                    elif changed.get(collection, set()) is not None:
+                        changed.setdefault(collection, set()).add(doc_id)
+                    continue
+                # Nothing more buffered, apply what arrived together
+                if changed:
+                    await self._apply(changed)
+                    changed = {}
+                # Only advance the token once everything before it has been applied
+                self._token = stream.resume_token
+                await self._save_token()
+
+    async def _run_change_stream(self) -> None:
+        """Follow the change stream, only returns if the server doesn't support change streams."""
+        loaded = False
+        while True:
+            try:
+                if not loaded:
+                    await self._load_token()
+                    await self._load_ids()
+                    loaded = True
+                await self._watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    return
+                if e.code in RESUME_TOKEN_LOST:
+                    logger.warning("Change stream can't resume from the saved token, refreshing all caches")
+                    self._token = None
+                    await self._load_ids()
+                    await self._refresh_everything()
+                    continue
+                logger.exception("Change stream failed, reopening it")
+            except PyMongoError:
+                logger.exception("Change stream failed, reopening it")
+            self.errors += 1
+            await asyncio.sleep(CHANGE_FEED_RETRY_DELAY)
+
+    # Version counter polling
+
+    async def _versions(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            counter["_id"]: counter
+            async for counter in self.db.change_versions.find({"_id": {"$in": list(self.handlers)}})
+        }
+
+    async def _poll(self, seen: Dict[str, int]) -> None:
+        for collection, counter in (await self._versions()).items():
+            version = counter["version"]
+            # Counters are created by the first write to their collection
+            missed = version - seen.get(collection, 0)
+            seen[collection] = version
+            if missed == 0:
+                continue
+            recent = counter.get("recent") or []
+            if missed < 0 or missed > len(recent):
+                self.events += max(missed, 1)
+                await self._apply({collection: None})
+                continue
+            ids: Optional[Set[str]] = set()
+            for entry in recent[-missed:]:
+                self.events += 1
+                if entry["node"] == self.node:
+                    continue
+                if entry["ids"] is None:
+                    ids = None
+                    break
+                ids.update(entry["ids"])
+            if ids is None or ids:
+                await self._apply({collection: ids})
+
+    async def _run_polling(self) -> None:
+        self.source = "version_poll"
+        seen: Optional[Dict[str, int]] = None
+        while True:
+            try:
+                if seen is None:
+                    # The caches of a starting process are empty, only later changes matter
+                    seen = {collection: counter["version"] for collection, counter in (await self._versions()).items()}
+                else:
+                    await self._poll(seen)
+            except PyMongoError:
+                logger.exception("Polling change versions failed")
+                self.errors += 1
+            await asyncio.sleep(CHANGE_FEED_POLL_INTERVAL)
+
+    async def _run(self) -> None:
+        if self.mode != "poll":
+            await self._run_change_stream()
+            logger.info("Change streams aren't available, polling change versions every %ss", CHANGE_FEED_POLL_INTERVAL)
+        await self._run_polling()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.source == "change_stream":
+            try:
+                await self._save_token(force=True)
+            except PyMongoError:
+                logger.exception("Saving the change stream resume token failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "name": self.name,
+            "events": self.events,
+            "batches": self.batches,
+            "full_refreshes": self.full_refreshes,
+            "errors": self.errors,
+            "resume_token_saved": self._saved_token is not None,
+        }
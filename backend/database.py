@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from pymongo.topology_description import TopologyDescription
+
+from metrics import MongoCommandListener, MongoPoolListener
+
+logger = logging.getLogger(__name__)
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+# How long an operation waits for a usable server before failing, instead of pymongo's 30s
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+# How long an operation waits for a free connection once the pool is at its maximum
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+# Total time startup keeps retrying the first ping while Mongo comes up
+MONGO_WARMUP_TIMEOUT = float(os.environ.get('MONGO_WARMUP_TIMEOUT', '30'))
+HEALTH_PING_TIMEOUT = 2.0
+
+
+class MongoDatabase:
+    """Owns the Motor client and its connection pool.
+
+    The client is created with connect=False, so importing the app opens no
+    sockets and starts no monitor threads. connect() runs from the app lifespan:
+    it waits for a server and fills the pool up to min_pool_size before the
+    first request, and close() releases everything on shutdown.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        name: str,
+        max_pool_size: int = MONGO_MAX_POOL_SIZE,
+        min_pool_size: int = MONGO_MIN_POOL_SIZE,
+    ):
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min(min_pool_size, max_pool_size)
+        self.pool = MongoPoolListener()
+        self.client = AsyncIOMotorClient(
+            url,
+            connect=False,
+            maxPoolSize=max_pool_size,
+            minPoolSize=self.min_pool_size,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            event_listeners=[MongoCommandListener(), self.pool],
+        )
+        self.db = self.client[name]
+        self.warmup_ms: Optional[float] = None
+
+    async def connect(self, timeout: float = MONGO_WARMUP_TIMEOUT) -> None:
+        """Wait for Mongo and open min_pool_size connections.
+
+        Raises the last error if Mongo doesn't answer within timeout, so a worker
+        that can't reach it fails its startup rather than serving errors.
+        """
+        started = time.perf_counter()
+        deadline = started + timeout
+        delay = 0.5
+        while True:
+            try:
+                await self.db.command("ping")
+                break
+            except PyMongoError as e:
+                if time.perf_counter() + delay > deadline:
+                    logger.error("Mongo unreachable after %.0fs", timeout)
+                    raise
+                logger.warning("Waiting for Mongo: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5)
+
+        # Concurrent pings each check out a connection, so the pool grows to
+        # min_pool_size now rather than on the first burst of traffic
+        results = await asyncio.gather(
+            *(self.db.command("ping") for _ in range(self.min_pool_size)), return_exceptions=True
+        )
+        failed = sum(isinstance(result, Exception) for result in results)
+        if failed:
+            logger.warning("%d of %d warm-up pings to Mongo failed", failed, len(results))
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 3)
+        logger.info("Mongo pool warmed up with %d connections in %.1fms", self.pool.stats()["open"], self.warmup_ms)
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _servers(self) -> Optional[List[Dict[str, Any]]]:
+        # The heartbeat round trip is measured by pymongo's monitor threads on their own sockets
+        topology = getattr(self.client, "topology_description", None)
+        if not isinstance(topology, TopologyDescription):
+            return None
+        return [
+            {
+                "address": f"{host}:{port}",
+                "type": server.server_type_name,
+                "rtt_ms": round(server.round_trip_time * 1000, 3) if server.round_trip_time is not None else None,
+            }
+            for (host, port), server in topology.server_descriptions().items()
+        ]
+
+    async def health(self) -> Dict[str, Any]:
+        """Pool state, server round trips and a ping, without opening a connection for it.
+
+        The ping only runs when an idle pooled connection can take it, otherwise
+        the monitors' heartbeat round trip has to do.
+        """
+        pool = self.pool.stats()
+        servers = self._servers()
+        ping_ms = None
+        error = None
+        if servers is None or pool["idle"] > 0:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.db.command("ping"), HEALTH_PING_TIMEOUT)
+                ping_ms = round((time.perf_counter() - started) * 1000, 3)
+            except (PyMongoError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+        reachable = ping_ms is not None or (
+            error is None and any(server["type"] != "Unknown" for server in servers or [])
+        )
+        return {
+            "status": "ok" if reachable else "unavailable",
+            "ping_ms": ping_ms,
+            **({"error": error} if error else {}),
+            "servers": servers,
+            "pool": {
+                "max_size": self.max_pool_size,
+                "min_size": self.min_pool_size,
+                **pool,
+            },
+            "warmup_ms": self.warmup_ms,
+        }
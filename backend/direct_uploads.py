@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from auth import issue_upload_token
+from storage import MAX_UPLOAD_SIZE, add_blob, save_stream
+
+logger = logging.getLogger(__name__)
+
+# How long the browser has to send the file once an upload is created
+UPLOAD_URL_TTL = int(os.environ.get('UPLOAD_URL_TTL', '3600'))
+# Files of uploads that were never completed are deleted after they expire
+UPLOAD_SWEEP_INTERVAL = float(os.environ.get('UPLOAD_SWEEP_INTERVAL', '3600'))
+# An expired upload still completing after this long belongs to a process that died mid-way
+UPLOAD_COMPLETE_TIMEOUT = float(os.environ.get('UPLOAD_COMPLETE_TIMEOUT', '600'))
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Upload states stored in status on the pdf_uploads record
+PENDING = "pending"  # waiting for the file
+RECEIVED = "received"  # sent through the local upload handler
+COMPLETING = "completing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def staging_location(store, upload_id: str) -> str:
+    return store.location(f"incoming/{upload_id}.pdf")
+
+
+async def create_upload(
+    db,
+    store,
+    metadata: Dict[str, Any],
+    filename: str,
+    size: int,
+    sha256: str,
+    local_url: Callable[[str], str],
+) -> Dict[str, Any]:
+    """Record an upload and return where the browser should send the file.
+
+    S3 stores get a presigned POST that only accepts exactly size bytes with
+    this hash. Local stores get a token-signed PUT to local_url(upload_id).
+    """
+    if not filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    if size <= 0 or size > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE // (1024 * 1024)} MB"
+        )
+    sha256 = sha256.lower()
+    if not SHA256_RE.match(sha256):
+        raise HTTPException(status_code=400, detail="sha256 must be 64 hex characters")
+
+    upload_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    location = staging_location(store, upload_id)
+    await db.pdf_uploads.insert_one({
+        "id": upload_id,
+        "status": PENDING,
+        "filename": filename,
+        "size": size,
+        "sha256": sha256,
+        "metadata": metadata,
+        "location": location,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=UPLOAD_URL_TTL),
+    })
+
+    if store.kind == "s3":
+        post = await store.files.run(store.presigned_post, location, size, sha256, UPLOAD_URL_TTL)
+        target = {"method": "POST", "url": post["url"], "fields": post["fields"]}
+    else:
+        token = issue_upload_token(upload_id, UPLOAD_URL_TTL)
+        target = {"method": "PUT", "url": f"{local_url(upload_id)}?token={token}", "fields": {}}
+    return {"upload_id": upload_id, **target, "expires_in": UPLOAD_URL_TTL}
+
+
+async def receive_upload(db, store, upload_id: str, chunks: AsyncIterator[bytes], content_length: Optional[str]) -> None:
+    """Store the body of a local upload in staging, it is checked when the upload is completed."""
+    upload = await db.pdf_uploads.find_one({"id": upload_id}, {"_id": 0})
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload["status"] != PENDING:
+        raise HTTPException(status_code=409, detail=f"Upload is already {upload['status']}")
+
+    def too_large() -> HTTPException:
+        return HTTPException(status_code=413, detail="File is larger than the size declared for this upload")
+
+    if content_length is not None and content_length.isdigit() and int(content_length) > upload["size"]:
+        raise too_large()
+    stored = await save_stream(chunks, store.spool_dir, store.files, max_size=upload["size"], too_large=too_large)
+    try:
+        await store.put(stored.path, upload["location"])
+    except BaseException:
+        await store.files.unlink(stored.path)
+        raise
+    await db.pdf_uploads.update_one({"id": upload_id, "status": PENDING}, {"$set": {"status": RECEIVED}})
+
+
+async def complete_upload(db, store, upload_id: str) -> Tuple[Dict[str, Any], str]:
+    """Check the staged file against the declared size and hash and move it into the blob store.
+
+    Returns the upload record and the blob location. The caller creates the
+    PDF record and then calls mark_completed.
+    """
+    upload = await db.pdf_uploads.find_one_and_update(
+        {"id": upload_id, "status": {"$in": [PENDING, RECEIVED]}},
+        {"$set": {"status": COMPLETING, "completing_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0},
+    )
+    if upload is None:
+        existing = await db.pdf_uploads.find_one({"id": upload_id}, {"_id": 0, "status": 1})
+        if existing is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        raise HTTPException(status_code=409, detail=f"Upload is already {existing['status']}")
+
+    async def restore() -> None:
+        await db.pdf_uploads.update_one({"id": upload_id}, {"$set": {"status": upload["status"]}})
+
+    try:
+        checksum = await store.checksum(upload["location"])
+        if checksum is None:
+            await restore()
+            raise HTTPException(status_code=409, detail="The file hasn't been uploaded yet")
+        size, sha256 = checksum
+        if size != upload["size"] or sha256 != upload["sha256"]:
+            await store.delete(upload["location"])
+            await mark_failed(db, upload_id, "size or hash mismatch")
+            raise HTTPException(status_code=422, detail="The uploaded file doesn't match the declared size and hash")
+
+        location = await add_blob(
+            db, store, sha256, size, lambda blob_location: store.move(upload["location"], blob_location)
+        )
+    except HTTPException:
+        raise
+    except BaseException:
+        await restore()
+        raise
+    return upload, location
+
+
+async def mark_completed(db, upload_id: str, pdf_id: str) -> None:
+    await db.pdf_uploads.update_one({"id": upload_id}, {"$set": {"status": COMPLETED, "pdf_id": pdf_id}})
+
+
+async def mark_failed(db, upload_id: str, error: str) -> None:
+    await db.pdf_uploads.update_one({"id": upload_id}, {"$set": {"status": FAILED, "error": error}})
+
+
+async def expire_uploads(db, store) -> int:
+    """Delete expired uploads, and the staged files of those that never completed."""
+    now = datetime.now(timezone.utc)
+    expired = 0
+    async for upload in db.pdf_uploads.find(
+        {"$or": [
+            {"status": {"$in": [PENDING, RECEIVED, FAILED]}},
+            {"status": COMPLETING, "completing_at": {"$lt": now - timedelta(seconds=UPLOAD_COMPLETE_TIMEOUT)}},
+        ], "expires_at": {"$lt": now}},
+        {"_id": 0, "id": 1, "location": 1}
+    ):
+        await store.delete(upload["location"])
+        await db.pdf_uploads.delete_one({"id": upload["id"]})
+        expired += 1
+    await db.pdf_uploads.delete_many({"status": COMPLETED, "expires_at": {"$lt": now}})
+    return expired
+
+
+async def sweep_uploads(db, store, interval: float = UPLOAD_SWEEP_INTERVAL) -> None:
+    while True:
+        try:
+            expired = await expire_uploads(db, store)
+            if expired:
+                logger.info("Removed %d expired direct uploads", expired)
+        except Exception:
+            # Mongo or the store is down, try again next round
+            logger.exception("Sweeping expired direct uploads failed")
+        await asyncio.sleep(interval)
+
+
+def start_upload_sweeper(db, store) -> asyncio.Task:
+    return asyncio.create_task(sweep_uploads(db, store))
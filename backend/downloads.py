@@ -0,0 +1,287 @@
+import os
+import secrets
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from cache import LRUCache
+from filestore import FileStore
+from metrics import pdf_bytes_served
+
+# pdf_id -> DownloadInfo, so repeat downloads skip the Mongo lookup
+DOWNLOAD_CACHE_SIZE = int(os.environ.get('DOWNLOAD_CACHE_SIZE', '4096'))
+DOWNLOAD_CACHE_TTL = float(os.environ.get('DOWNLOAD_CACHE_TTL', '300'))
+download_cache = LRUCache(DOWNLOAD_CACHE_SIZE, DOWNLOAD_CACHE_TTL)
+
+# Requests asking for more ranges than this get the whole file instead
+MAX_RANGES = 16
+READ_CHUNK_SIZE = 64 * 1024
+
+MEDIA_TYPE = "application/pdf"
+
+# How file bytes are delivered: "direct" streams them from this process,
+# "x-accel" hands off to nginx and "x-sendfile" to Apache/lighttpd
+DELIVERY_MODE = os.environ.get('PDF_DELIVERY_MODE', 'direct').lower()
+# nginx internal location that maps onto UPLOAD_DIR
+ACCEL_REDIRECT_PREFIX = os.environ.get('PDF_ACCEL_REDIRECT_PREFIX', '/protected-uploads/')
+
+
+@dataclass
+class DownloadInfo:
+    path: Path
+    filename: str
+    etag: str
+    size: int
+    last_modified: float
+    stat: Optional[os.stat_result] = None
+
+
+async def build_download_info(pdf_doc: dict, files: FileStore) -> Optional[DownloadInfo]:
+    """Stat the file behind a PDF record, returns None if it is missing.
+
+    The optimized (linearized) copy is served when processing produced one.
+    """
+    optimized = False
+    stat = None
+    if pdf_doc.get("optimized_path"):
+        path = Path(pdf_doc["optimized_path"])
+        stat = await files.stat(path)
+        optimized = stat is not None
+    if stat is None:
+        path = Path(pdf_doc["file_path"])
+        stat = await files.stat(path)
+        if stat is None:
+            return None
+
+    # Content-addressed files get a strong ETag from their hash, older uploads from mtime and size
+    if pdf_doc.get("sha256"):
+        etag = f'"{pdf_doc["sha256"]}-web"' if optimized else f'"{pdf_doc["sha256"]}"'
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    return DownloadInfo(
+        path=path,
+        filename=pdf_doc["filename"],
+        etag=etag,
+        size=stat.st_size,
+        last_modified=stat.st_mtime,
+        stat=stat,
+    )
+
+
+def _opaque_tag(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_not_modified(request: Request, info: DownloadInfo) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232 section 6)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = [_opaque_tag(tag.strip()) for tag in if_none_match.split(",")]
+        return info.etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and int(info.last_modified) <= since
+    return False
+
+
+def _if_range_matches(request: Request, info: DownloadInfo) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(("\"", "W/")):
+        # If-Range requires a strong comparison
+        return if_range == info.etag
+    since = _parse_http_date(if_range)
+    return since is not None and int(info.last_modified) == since
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a Range header into sorted, merged inclusive byte ranges.
+
+    Returns None when the header should be ignored and the whole file served,
+    and raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        start, sep, end = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start:
+                first = int(start)
+                # Open-ended ranges run to the end, one starting past it is unsatisfiable below
+                last = int(end) if end else max(first, size - 1)
+                if last < first:
+                    return None
+            else:
+                # Suffix range: the final N bytes
+                suffix = int(end)
+                if suffix == 0:
+                    continue
+                first, last = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+        if first < 0:
+            return None
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        prev_first, prev_last = merged[-1]
+        if first <= prev_last + 1:
+            merged[-1] = (prev_first, max(prev_last, last))
+        else:
+            merged.append((first, last))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+async def _read_ranges(path: Path, parts: List[Tuple[bytes, int, int]], trailer: bytes):
+    async with await anyio.open_file(path, "rb") as f:
+        for header, first, last in parts:
+            if header:
+                yield header
+            await f.seek(first)
+            remaining = last - first + 1
+            while remaining > 0:
+                chunk = await f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    if trailer:
+        yield trailer
+
+
+def build_offload_response(info: DownloadInfo, upload_dir: Path, mode: str) -> Optional[Response]:
+    """Return an empty response telling the reverse proxy which file to send.
+
+    The proxy serves the bytes itself (with sendfile, ranges and caching), so
+    the worker is free as soon as the headers are written. Returns None when
+    the file lives outside upload_dir and can't be mapped to the proxy.
+    """
+    headers = {
+        "Content-Type": MEDIA_TYPE,
+        "Content-Disposition": content_disposition(info.filename),
+        "ETag": info.etag,
+    }
+    if mode == "x-accel":
+        try:
+            relative = info.path.relative_to(upload_dir)
+        except ValueError:
+            return None
+        headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative.as_posix())
+    elif mode == "x-sendfile":
+        headers["X-Sendfile"] = str(info.path)
+    else:
+        return None
+    return Response(headers=headers)
+
+
+def build_file_response(request: Request, info: DownloadInfo, upload_dir: Path) -> Response:
+    """Serve a PDF honouring conditional GET and byte range requests."""
+    headers = {
+        "ETag": info.etag,
+        "Last-Modified": formatdate(info.last_modified, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    if is_not_modified(request, info):
+        return Response(status_code=304, headers=headers)
+
+    if DELIVERY_MODE != "direct":
+        response = build_offload_response(info, upload_dir, DELIVERY_MODE)
+        if response is not None:
+            # The proxy may only send part of it for a Range request, this counts the whole file
+            pdf_bytes_served.inc(DELIVERY_MODE, amount=info.size)
+            return response
+
+    range_header = request.headers.get("range")
+    ranges = None
+    if range_header and _if_range_matches(request, info):
+        try:
+            ranges = parse_range(range_header, info.size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{info.size}"
+            return Response(status_code=416, headers=headers)
+
+    if ranges is None:
+        pdf_bytes_served.inc("direct", amount=info.size)
+        # Reuse the stat from build_download_info rather than have FileResponse repeat it
+        return FileResponse(
+            path=info.path, filename=info.filename, media_type=MEDIA_TYPE, headers=headers, stat_result=info.stat
+        )
+
+    headers["Content-Disposition"] = content_disposition(info.filename)
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        headers["Content-Range"] = f"bytes {first}-{last}/{info.size}"
+        headers["Content-Length"] = str(last - first + 1)
+        pdf_bytes_served.inc("direct", amount=last - first + 1)
+        return StreamingResponse(
+            _read_ranges(info.path, [(b"", first, last)], b""),
+            status_code=206,
+            media_type=MEDIA_TYPE,
+            headers=headers,
+        )
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    length = 0
+    for index, (first, last) in enumerate(ranges):
+        # Each part after the first is separated from the previous body by CRLF
+        separator = b"\r\n" if index else b""
+        part_header = separator + (
+            f"--{boundary}\r\n"
+            f"Content-Type: {MEDIA_TYPE}\r\n"
+            f"Content-Range: bytes {first}-{last}/{info.size}\r\n\r\n"
+        ).encode()
+        parts.append((part_header, first, last))
+        length += len(part_header) + last - first + 1
+    trailer = f"\r\n--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(length + len(trailer))
+    pdf_bytes_served.inc("direct", amount=length + len(trailer))
+    return StreamingResponse(
+        _read_ranges(info.path, parts, trailer),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
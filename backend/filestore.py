@@ -0,0 +1,119 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TypeVar, Union
+
+from cache import LRUCache
+
+# Filesystem calls get their own threads, so a stalled network volume can't
+# starve the threadpool the rest of the app shares
+FILE_IO_THREADS = int(os.environ.get('FILE_IO_THREADS', '16'))
+# Seconds a stat result (or a missing file) is remembered
+FILE_STAT_TTL = float(os.environ.get('FILE_STAT_TTL', '2'))
+FILE_STAT_CACHE_SIZE = int(os.environ.get('FILE_STAT_CACHE_SIZE', '4096'))
+
+T = TypeVar("T")
+PathLike = Union[str, Path]
+
+# Cached in place of a stat result for files that don't exist
+_MISSING = object()
+
+
+class FileStore:
+    """Runs filesystem metadata and mutation calls off the event loop.
+
+    Calls go to a bounded thread pool. Concurrent stats of the same path share
+    one syscall, and results, including missing files, are cached for ttl
+    seconds. Writers that create or remove a file call invalidate() so the
+    cache doesn't hide the change.
+    """
+
+    def __init__(self, max_workers: int = FILE_IO_THREADS, ttl: float = FILE_STAT_TTL, maxsize: int = FILE_STAT_CACHE_SIZE):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = LRUCache(maxsize, ttl)
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        # Metrics
+        self.calls = 0
+        self.stat_hits = 0
+        self.stat_misses = 0
+        self.stat_coalesced = 0
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="file-io")
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    @staticmethod
+    def _stat_or_missing(path: str) -> Any:
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return _MISSING
+
+    async def stat(self, path: PathLike) -> Optional[os.stat_result]:
+        """os.stat of path, None if it doesn't exist."""
+        key = str(path)
+        result = self._stats.get(key)
+        if result is not None:
+            self.stat_hits += 1
+            return None if result is _MISSING else result
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stat_coalesced += 1
+            result = await asyncio.shield(inflight)
+            return None if result is _MISSING else result
+
+        self.stat_misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self.run(self._stat_or_missing, key)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            # Only cache results that weren't invalidated while the syscall ran
+            if self._inflight.get(key) is future:
+                self._stats.set(key, result)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        return None if result is _MISSING else result
+
+    async def exists(self, path: PathLike) -> bool:
+        return await self.stat(path) is not None
+
+    async def unlink(self, path: PathLike, missing_ok: bool = True) -> None:
+        try:
+            await self.run(Path(path).unlink, missing_ok)
+        finally:
+            self.invalidate(path)
+
+    def invalidate(self, path: PathLike) -> None:
+        key = str(path)
+        self._stats.pop(key)
+        self._inflight.pop(key, None)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threads": self.max_workers,
+            "calls": self.calls,
+            "stat_cache_size": len(self._stats),
+            "stat_hits": self.stat_hits,
+            "stat_misses": self.stat_misses,
+            "stat_coalesced": self.stat_coalesced,
+        }
@@ -0,0 +1,64 @@
+# Multi-worker production server. From this directory run:
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# Each worker is a separate process with its own event loop, Mongo pool and
+# in-process caches. Set STATE_BACKEND=redis (and REDIS_URL) so rate limits
+# and cached responses are shared between them.
+#
+# kill -TERM <master> stops gracefully, kill -HUP <master> replaces the
+# workers without dropping requests. Retired workers stop accepting
+# connections and get GRACEFUL_TIMEOUT seconds to finish in-flight downloads
+# and uploads before the app shuts down.
+import multiprocessing
+import os
+import secrets
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Read .env here too, the master decides on defaults the workers inherit
+load_dotenv(Path(__file__).parent / '.env')
+
+wsgi_app = "server:app"
+worker_class = "worker.DrainingUvicornWorker"
+bind = os.environ.get('BIND', '0.0.0.0:8001')
+workers = int(os.environ.get('WEB_CONCURRENCY', str(min(4, multiprocessing.cpu_count()))))
+
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '60'))
+# Workers that miss heartbeats for this long are restarted
+timeout = int(os.environ.get('WORKER_TIMEOUT', '60'))
+keepalive = int(os.environ.get('KEEPALIVE', '5'))
+# Recycle workers after this many requests, 0 never does. The jitter keeps them from restarting together.
+max_requests = int(os.environ.get('MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', str(max_requests // 10)))
+
+# Import the app once in the master and fork it. Saves memory and startup
+# time, but code changes then need a full restart rather than a HUP. Nothing
+# connects at import time (Mongo uses connect=False, Redis and the thread
+# pools are created on first use), so the forked workers share no sockets.
+preload_app = os.environ.get('PRELOAD_APP') == '1'
+
+# The proxy in front sets X-Forwarded-*, see nginx.example.conf
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+accesslog = os.environ.get('ACCESS_LOG') or None
+
+# Admin and upload tokens are signed with JWT_SECRET. Without one every worker
+# would make up its own and reject the others' tokens, so pick one for all
+# workers of this master. Tokens still won't survive a restart.
+generated_jwt_secret = not os.environ.get('JWT_SECRET')
+if generated_jwt_secret:
+    os.environ['JWT_SECRET'] = secrets.token_urlsafe(32)
+
+
+def on_starting(server):
+    if generated_jwt_secret:
+        server.log.warning("JWT_SECRET is not set, generated one for this server's workers")
+    if workers > 1:
+        backends = {
+            "Cached responses": os.environ.get('RESPONSE_CACHE_BACKEND', os.environ.get('STATE_BACKEND', 'memory')),
+            "Rate limits": os.environ.get('RATE_LIMIT_BACKEND', os.environ.get('STATE_BACKEND', 'memory')),
+        }
+        for name, backend in backends.items():
+            if backend.lower() != "redis":
+                server.log.warning("%s are kept per worker with %d workers, set STATE_BACKEND=redis", name, workers)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Indexes required by the API routes, keyed by collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "pdf_documents": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("upload_date", DESCENDING), ("id", DESCENDING)], name="upload_date_id"),
+        IndexModel(
+            [("exam_type", ASCENDING), ("upload_date", DESCENDING), ("id", DESCENDING)],
+            name="exam_type_upload_date_id",
+        ),
+        # Every worker looks for unclaimed processing jobs and expired leases periodically
+        IndexModel([("processing_status", ASCENDING), ("processing_started_at", ASCENDING)], name="processing_status_started_at"),
+    ],
+    "pdf_blobs": [
+        IndexModel([("sha256", ASCENDING)], unique=True, name="sha256_unique"),
+    ],
+    "class_schedules": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "pdf_uploads": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)], name="status_expires_at"),
+    ],
+    "contact_messages": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+    ],
+}
+
+PROBE_DATE = datetime(2024, 1, 1)
+
+# The query shape of every route and background job that reads or writes by key: (name, collection, filter, sort).
+# GET /api/schedule returns the whole collection unsorted, so it is a scan by design and isn't listed,
+# and neither are the one-off migrations in storage.py.
+ROUTE_QUERIES: List[Tuple[str, str, Dict[str, Any], List[Tuple[str, int]]]] = [
+    ("get_all_pdfs", "pdf_documents", {}, [("upload_date", DESCENDING), ("id", DESCENDING)]),
+    ("get_pdfs_by_exam", "pdf_documents", {"exam_type": "SSC"}, [("upload_date", DESCENDING), ("id", DESCENDING)]),
+    ("get_pdfs_next_page", "pdf_documents", {"$or": [
+        {"upload_date": {"$lt": PROBE_DATE}},
+        {"upload_date": PROBE_DATE, "id": {"$lt": "probe"}},
+    ]}, [("upload_date", DESCENDING), ("id", DESCENDING)]),
+    ("search_pdfs", "pdf_documents", {"id": {"$in": ["probe", "other"]}}, []),
+    ("download_pdf", "pdf_documents", {"id": "probe"}, []),
+    ("delete_pdf", "pdf_documents", {"id": "probe"}, []),
+    ("get_contact_messages", "contact_messages", {}, [("timestamp", DESCENDING)]),
+    ("delete_class_schedule", "class_schedules", {"id": "probe"}, []),
+    ("bulk_delete_class_schedules", "class_schedules", {"id": {"$in": ["probe", "other"]}}, []),
+    # Blob references, taken and released on every upload and delete
+    ("add_blob", "pdf_blobs", {"sha256": "probe", "deleting": None}, []),
+    ("release_blob", "pdf_blobs", {"sha256": "probe"}, []),
+    # Direct uploads and their sweeper
+    ("complete_upload", "pdf_uploads", {"id": "probe", "status": {"$in": ["pending", "received"]}}, []),
+    ("expire_uploads", "pdf_uploads", {"$or": [
+        {"status": {"$in": ["pending", "received", "failed"]}},
+        {"status": "completing", "completing_at": {"$lt": PROBE_DATE}},
+    ], "expires_at": {"$lt": PROBE_DATE}}, []),
+    ("expire_completed_uploads", "pdf_uploads", {"status": "completed", "expires_at": {"$lt": PROBE_DATE}}, []),
+    # PDF processing jobs, resumed by every worker and claimed one at a time
+    ("resume_processing", "pdf_documents", {"$or": [
+        {"processing_status": "pending"},
+        {"processing_status": "processing", "processing_started_at": {"$not": {"$gte": PROBE_DATE}}},
+    ]}, []),
+    ("backfill_processing_status", "pdf_documents", {"processing_status": None}, []),
+    ("claim_processing_job", "pdf_documents", {"id": "probe", "$or": [
+        {"processing_status": "pending"},
+        {"processing_status": "processing", "processing_started_at": {"$not": {"$gte": PROBE_DATE}}},
+    ]}, []),
+]
+
+
+async def ensure_indexes(db) -> None:
+    """Create all declared indexes. create_indexes is a no-op for existing ones."""
+    for collection, models in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(models)
+            logger.info("Ensured indexes on %s: %s", collection, ", ".join(names))
+        except PyMongoError:
+            logger.exception("Failed to create indexes on %s", collection)
+
+
+def start_index_bootstrap(db) -> asyncio.Task:
+    # Run in the background so a large collection doesn't hold up startup
+    return asyncio.create_task(ensure_indexes(db))
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+
+async def find_collscans(db) -> List[str]:
+    """Explain every route query and return the names of those that scan the collection."""
+    scanning = []
+    for name, collection, query, sort in ROUTE_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        # Newer servers wrap the classic plan in a queryPlan document
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            scanning.append(name)
+    return scanning
+
+
+async def assert_no_collscan(db) -> None:
+    """Test helper: fail if any route query is planned as a COLLSCAN."""
+    scanning = await find_collscans(db)
+    assert not scanning, f"COLLSCAN plan for: {', '.join(scanning)}"
+
+
+if __name__ == "__main__":
+    # Create the indexes and verify the query plans against the configured database
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pathlib import Path
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        await ensure_indexes(db)
+        await assert_no_collscan(db)
+        print("All route queries use an index")
+        client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from tracing import span
+
+# Page size limits for list endpoints
+DEFAULT_PAGE_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT', '100'))
+MAX_PAGE_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT', '500'))
+
+# Fields that are always returned because the cursor is built from them
+CURSOR_FIELDS = ("id", "upload_date")
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if limit is None:
+        return DEFAULT_PAGE_LIMIT
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
+
+def encode_cursor(upload_date: datetime, doc_id: str) -> str:
+    payload = json.dumps({"d": upload_date.isoformat(), "i": doc_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["d"]), str(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def build_projection(fields: Optional[str], allowed: List[str]) -> Optional[Dict[str, int]]:
+    """Turn a comma separated ``fields=`` value into a Mongo projection."""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    projection = {f: 1 for f in (*CURSOR_FIELDS, *requested)}
+    projection["_id"] = 0
+    return projection
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, int]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Keyset pagination on (upload_date desc, id desc).
+
+    Returns the page of raw documents and the cursor for the next page,
+    or None when there are no more results.
+    """
+    limit = clamp_limit(limit)
+    query = dict(query)
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"upload_date": {"$lt": last_date}},
+            {"upload_date": last_date, "id": {"$lt": last_id}},
+        ]
+
+    # Fetch one extra row to know whether another page exists
+    with span("mongo.find", collection=collection.name):
+        docs = await (
+            collection.find(query, projection)
+            .sort([("upload_date", -1), ("id", -1)])
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last["upload_date"], last["id"])
+    return docs, next_cursor
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bound the work done per document, notes are rarely searched past the first pages
+MAX_TEXT_PAGES = int(os.environ.get('PDF_TEXT_MAX_PAGES', '50'))
+MAX_TEXT_CHARS = int(os.environ.get('PDF_TEXT_MAX_CHARS', '200000'))
+
+PDF_PROCESS_WORKERS = int(os.environ.get('PDF_PROCESS_WORKERS', '2'))
+THUMBNAIL_WIDTH = int(os.environ.get('PDF_THUMBNAIL_WIDTH', '320'))
+
+# Linearize ("fast web view") and recompress uploads, the original is kept next to the result
+PDF_OPTIMIZE = os.environ.get('PDF_OPTIMIZE') == '1'
+# Linearization hint tables add a little, drop results that grow the file by more than this
+OPTIMIZE_MAX_GROWTH = float(os.environ.get('PDF_OPTIMIZE_MAX_GROWTH', '0.02'))
+# A job claimed by a worker that hasn't finished it after this many seconds is
+# assumed lost with its process and may be claimed again
+PROCESSING_LEASE = float(os.environ.get('PDF_PROCESSING_LEASE', '900'))
+
+# Job states stored in processing_status on the PDF record
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+
+def read_pdf(path: Path) -> Tuple[Optional[int], str]:
+    """Return the page count and plain text of a PDF. Blocking, run it off the event loop.
+
+    The text is empty for scans without a text layer, and both are unknown for
+    unreadable files or when pypdf isn't installed.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logger.warning("pypdf is not installed, PDF content won't be extracted")
+        return None, ""
+
+    try:
+        reader = PdfReader(str(path))
+        parts = []
+        length = 0
+        for page in reader.pages[:MAX_TEXT_PAGES]:
+            text = page.extract_text() or ""
+            parts.append(text)
+            length += len(text)
+            if length >= MAX_TEXT_CHARS:
+                break
+        return len(reader.pages), "\n".join(parts)[:MAX_TEXT_CHARS]
+    except Exception as e:
+        logger.warning("Failed to read %s: %s", path, e)
+        return None, ""
+
+
+def render_thumbnail(path: Path, thumbnail_path: Path) -> bool:
+    """Render the first page to a JPEG, returns False if it couldn't be rendered."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        logger.warning("pypdfium2 is not installed, thumbnails won't be rendered")
+        return False
+
+    # Identical uploads share the thumbnail, jobs for them may render it at the same time
+    tmp_path = thumbnail_path.with_name(f".{thumbnail_path.name}.{os.getpid()}.part")
+    try:
+        pdf = pdfium.PdfDocument(str(path))
+        try:
+            page = pdf[0]
+            width, _ = page.get_size()
+            image = page.render(scale=THUMBNAIL_WIDTH / width).to_pil()
+        finally:
+            pdf.close()
+        thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+        image.convert("RGB").save(tmp_path, format="JPEG", quality=80, optimize=True)
+        os.replace(tmp_path, thumbnail_path)
+        return True
+    except Exception as e:
+        logger.warning("Failed to render thumbnail for %s: %s", path, e)
+        tmp_path.unlink(missing_ok=True)
+        return False
+
+
+def optimize_pdf(path: Path, optimized_path: Path) -> Optional[int]:
+    """Write a linearized, losslessly recompressed copy of a PDF.
+
+    Returns the size of the copy, or None if it couldn't be written or wasn't
+    worth keeping.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        logger.warning("pikepdf is not installed, PDFs won't be optimized")
+        return None
+
+    # Identical uploads share the optimized copy like they share the original
+    if optimized_path.exists():
+        return optimized_path.stat().st_size
+
+    tmp_path = optimized_path.with_name(f".{optimized_path.name}.{os.getpid()}.part")
+    try:
+        with pikepdf.open(path) as pdf:
+            pdf.save(
+                tmp_path,
+                linearize=True,
+                compress_streams=True,
+                recompress_flate=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            )
+        size = tmp_path.stat().st_size
+        if size > path.stat().st_size * (1 + OPTIMIZE_MAX_GROWTH):
+            tmp_path.unlink()
+            return None
+        os.replace(tmp_path, optimized_path)
+        return size
+    except Exception as e:
+        logger.warning("Failed to optimize %s: %s", path, e)
+        tmp_path.unlink(missing_ok=True)
+        return None
+
+
+def process_pdf(path: str, thumbnail_path: str, optimized_path: Optional[str] = None) -> Dict[str, Any]:
+    """Everything we learn about an uploaded PDF. Runs in a worker process."""
+    pdf_path = Path(path)
+    page_count, text = read_pdf(pdf_path)
+    result = {
+        "file_size": pdf_path.stat().st_size,
+        "page_count": page_count,
+        "has_thumbnail": render_thumbnail(pdf_path, Path(thumbnail_path)),
+        "extracted_text": text,
+    }
+    if optimized_path is not None:
+        optimized_size = optimize_pdf(pdf_path, Path(optimized_path))
+        result["optimized_size"] = optimized_size
+        result["optimized_path"] = optimized_path if optimized_size is not None else None
+    return result
+
+
+class ProcessingPipeline:
+    """Runs process_pdf for new uploads in a process pool and records the results.
+
+    Job state lives on the PDF record (processing_status), so jobs that were
+    pending when the server stopped are picked up again by resume(). A job is
+    claimed with a lease before it runs, so with several API workers each one
+    is processed once. Files are read from and written to the blob store,
+    which hands the workers local paths.
+    """
+
+    def __init__(
+        self,
+        db,
+        store,
+        on_done: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        workers: int = PDF_PROCESS_WORKERS,
+        optimize: bool = PDF_OPTIMIZE,
+    ):
+        self.db = db
+        self.store = store
+        self.on_done = on_done
+        self.workers = workers
+        self.optimize = optimize
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Running jobs by task, to the PDF id they work on
+        self._tasks: Dict[asyncio.Task, str] = {}
+        self._resume_task: Optional[asyncio.Task] = None
+        # Jobs wait for one of these before they claim their PDF, so leases only run
+        # while a job is being processed and at most `workers` files are fetched at once
+        self._slots = asyncio.Semaphore(workers)
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+    def thumbnail_location(self, pdf: Dict[str, Any]) -> str:
+        # Named after the content hash, identical files share a thumbnail
+        return self.store.location(f"thumbnails/{pdf.get('sha256') or pdf['id']}.jpg")
+
+    def optimized_location(self, pdf: Dict[str, Any]) -> str:
+        # Sits next to the original, so it is content addressed too: abcd.pdf -> abcd.web.pdf
+        root, _ = os.path.splitext(pdf["file_path"])
+        return f"{root}.web.pdf"
+
+    def _start_pool(self) -> None:
+        # spawn rather than fork, the parent has motor and executor threads running
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def start(self) -> None:
+        self._start_pool()
+        self._resume_task = asyncio.create_task(self._resume_periodically())
+
+    async def stop(self) -> None:
+        if self._resume_task is not None:
+            self._resume_task.cancel()
+            self._resume_task = None
+        interrupted = list(self._tasks.values())
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if interrupted:
+            # Hand the jobs back so the next worker to resume doesn't wait out the lease
+            await self.db.pdf_documents.update_many(
+                {"id": {"$in": interrupted}, "processing_status": PROCESSING},
+                {"$set": {"processing_status": PENDING}}
+            )
+
+    async def resume(self) -> None:
+        """Submit pending jobs and those whose lease ran out."""
+        # Records from before the pipeline have never been processed, this is where their text comes from
+        await self.db.pdf_documents.update_many(
+            {"processing_status": None}, {"$set": {"processing_status": PENDING}}
+        )
+        expired = datetime.now(timezone.utc) - timedelta(seconds=PROCESSING_LEASE)
+        running = set(self._tasks.values())
+        async for pdf in self.db.pdf_documents.find(
+            {"$or": [
+                {"processing_status": PENDING},
+                # Records from before leases have no processing_started_at and count as expired
+                {"processing_status": PROCESSING, "processing_started_at": {"$not": {"$gte": expired}}},
+            ]},
+            {"_id": 0, "extracted_text": 0}
+        ):
+            if pdf["id"] not in running:
+                self.submit(pdf)
+
+    async def _resume_periodically(self) -> None:
+        # Picks up the jobs of workers that died mid-job
+        while True:
+            await asyncio.sleep(PROCESSING_LEASE)
+            try:
+                await self.resume()
+            except Exception:
+                logger.exception("Resuming PDF processing jobs failed")
+
+    def submit(self, pdf: Dict[str, Any]) -> None:
+        task = asyncio.create_task(self._run(pdf))
+        self._tasks[task] = pdf["id"]
+        task.add_done_callback(lambda t: self._tasks.pop(t, None))
+
+    async def _claim(self, pdf_id: str) -> bool:
+        now = datetime.now(timezone.utc)
+        result = await self.db.pdf_documents.update_one(
+            {"id": pdf_id, "$or": [
+                {"processing_status": PENDING},
+                {"processing_status": PROCESSING, "processing_started_at": {"$not": {"$gte": now - timedelta(seconds=PROCESSING_LEASE)}}},
+            ]},
+            {"$set": {"processing_status": PROCESSING, "processing_started_at": now}}
+        )
+        return result.modified_count == 1
+
+    async def _run(self, pdf: Dict[str, Any]) -> None:
+        async with self._slots:
+            self.active += 1
+            try:
+                await self._process(pdf)
+            finally:
+                self.active -= 1
+
+    async def _process(self, pdf: Dict[str, Any]) -> None:
+        pdf_id = pdf["id"]
+        if not await self._claim(pdf_id):
+            # Another worker has it
+            return
+        loop = asyncio.get_running_loop()
+        optimized = self.optimized_location(pdf) if self.optimize else None
+        executor = self._executor
+        try:
+            async with AsyncExitStack() as stack:
+                source = await stack.enter_async_context(self.store.readable(pdf["file_path"]))
+                thumbnail_path = await stack.enter_async_context(self.store.writable(self.thumbnail_location(pdf)))
+                optimized_path = await stack.enter_async_context(self.store.writable(optimized)) if optimized else None
+                result = await loop.run_in_executor(
+                    executor, process_pdf, str(source), str(thumbnail_path),
+                    str(optimized_path) if optimized_path else None
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A worker died (e.g. OOM on a huge scan), later jobs need a fresh pool. Every job
+            # that was on the broken pool fails with this, only the first one replaces it
+            if isinstance(e, BrokenProcessPool) and self._executor is executor:
+                logger.error("PDF worker pool broke, restarting it")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._start_pool()
+            logger.exception("Processing PDF %s failed", pdf_id)
+            self.failed += 1
+            await self.db.pdf_documents.update_one(
+                {"id": pdf_id}, {"$set": {"processing_status": FAILED, "processing_error": str(e)}}
+            )
+            return
+
+        if result.get("optimized_path"):
+            result["optimized_path"] = optimized
+        result["processing_status"] = DONE
+        await self.db.pdf_documents.update_one({"id": pdf_id}, {"$set": result})
+        self.completed += 1
+        if self.on_done is not None:
+            await self.on_done({**pdf, **result})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.active,
+            "queued": len(self._tasks) - self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "workers": self.workers,
+            "optimize": self.optimize,
+        }
@@ -0,0 +1,241 @@
+import json
+import logging
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+import orjson
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from shared_state import STATE_BACKEND, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Unauthenticated routes a single client can hammer. Override with
+# RATE_LIMITS='{"POST /api/contact": "5/minute"}', an empty limit disables a rule.
+DEFAULT_RATE_LIMITS = {
+    "POST /api/contact": "5/minute",
+    "GET /api/pdfs/download/{pdf_id}": "60/minute",
+    "GET /api/pdfs/search": "60/minute",
+}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.environ.get('RATE_LIMITS') or '{}')}
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', STATE_BACKEND).lower()
+# Number of reverse proxies in front of the API, their X-Forwarded-For entries are skipped
+TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+# Idle buckets are dropped this often, a dropped bucket is indistinguishable from a full one
+SWEEP_INTERVAL = float(os.environ.get('RATE_LIMIT_SWEEP_INTERVAL', '60'))
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """A token bucket holding up to burst requests, refilled at rate per second."""
+
+    rate: float
+    burst: int
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """Parse "count/period" where period is second, minute, hour, day or a number of seconds."""
+        count, _, period = value.partition("/")
+        period = period.strip()
+        seconds = float(period) if period.replace(".", "", 1).isdigit() else PERIODS.get(period.rstrip("s"))
+        if not seconds or not count.strip().isdigit() or int(count) < 1:
+            raise ValueError(f"Invalid rate limit {value!r}")
+        return cls(rate=int(count) / seconds, burst=int(count))
+
+    @property
+    def refill_seconds(self) -> float:
+        return self.burst / self.rate
+
+
+@dataclass
+class Rule:
+    name: str
+    method: str
+    pattern: Pattern
+    limit: RateLimit
+
+
+def build_rules(limits: Dict[str, str]) -> List[Rule]:
+    rules = []
+    for name, value in limits.items():
+        if not value:
+            continue
+        method, _, template = name.partition(" ")
+        regex = re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(template))
+        rules.append(Rule(name, method.upper(), re.compile(f"^{regex}$"), RateLimit.parse(value)))
+    return rules
+
+
+class MemoryBucketStore:
+    """Token buckets local to this process, one [tokens, updated, refill_seconds] entry per key."""
+
+    def __init__(self, sweep_interval: float = SWEEP_INTERVAL):
+        self.buckets: Dict[str, List[float]] = {}
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        """Take a token, returns 0 if allowed or the seconds until one is available."""
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [limit.burst - 1, now, limit.refill_seconds]
+            return 0.0
+        tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / limit.rate
+
+    def _sweep(self, now: float) -> None:
+        # A bucket idle for its full refill time is full again, so forgetting it changes nothing
+        self.buckets = {key: b for key, b in self.buckets.items() if now - b[1] < b[2]}
+        self._last_sweep = now
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+
+# Runs atomically in Redis with the server clock, so every worker shares one bucket per key
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+  tokens = burst
+else
+  tokens = math.min(burst, tokens + (now - tonumber(bucket[2])) * rate)
+end
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared between workers through a Redis-compatible server.
+
+    Buckets expire once they would have refilled, which does the eviction.
+    """
+
+    def __init__(self, client=None, prefix: str = "ratelimit"):
+        self.client = client if client is not None else redis_client("RATE_LIMIT_BACKEND=redis")
+        self.prefix = prefix
+        self._script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        wait = await self._script(keys=[f"{self.prefix}:{key}"], args=[limit.rate, limit.burst])
+        return float(wait)
+
+    def __len__(self) -> int:
+        return 0
+
+
+def client_ip(scope: Scope, trusted_proxies: int = TRUSTED_PROXIES) -> str:
+    if trusted_proxies:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            # Each proxy appends the address it saw, so skip the ones we added ourselves
+            hops = [hop.strip() for hop in forwarded.split(",")]
+            return hops[max(0, len(hops) - trusted_proxies)]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimiter:
+    """Per (client IP, route) limits for the routes that have a rule.
+
+    A store outage lets requests through rather than failing them.
+    """
+
+    def __init__(self, rules: List[Rule], store):
+        self.rules = rules
+        self.store = store
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    def match(self, method: str, path: str) -> Optional[Rule]:
+        for rule in self.rules:
+            if rule.method == method and rule.pattern.match(path):
+                return rule
+        return None
+
+    async def check(self, scope: Scope) -> float:
+        """Returns 0 if the request may go ahead, otherwise the seconds to wait."""
+        rule = self.match(scope["method"], scope["path"])
+        if rule is None:
+            return 0.0
+        try:
+            wait = await self.store.take(f"{client_ip(scope)}|{rule.name}", rule.limit)
+        except Exception:
+            logger.exception("Rate limit store failed")
+            self.errors += 1
+            return 0.0
+        if wait > 0:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.store).__name__,
+            "rules": {rule.name: {"rate": rule.limit.rate, "burst": rule.limit.burst} for rule in self.rules},
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "errors": self.errors,
+            "buckets": len(self.store),
+        }
+
+
+class RateLimitMiddleware:
+    """Answers 429 with Retry-After once a client runs out of tokens for a route."""
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        wait = await self.limiter.check(scope)
+        if wait <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        body = orjson.dumps({"detail": "Too many requests, please try again later"})
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+        ]
+        await send({"type": "http.response.start", "status": 429, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def create_rate_limiter() -> RateLimiter:
+    store = RedisBucketStore() if RATE_LIMIT_BACKEND == "redis" else MemoryBucketStore()
+    return RateLimiter(build_rules(RATE_LIMITS), store)
@@ -0,0 +1,235 @@
+import asyncio
+import bisect
+import gzip
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SAVE_INTERVAL = float(os.environ.get('SEARCH_SAVE_INTERVAL', '30'))
+
+# Metadata matches count for more than matches in the body text
+FIELD_WEIGHTS = {
+    "title": 3,
+    "subject": 2,
+    "exam_type": 2,
+    "batch": 1,
+    "description": 1,
+    "content": 1,
+}
+# Prefix expansions score lower than exact term matches and are capped per query term
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_EXPANSIONS = 50
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset("a an and are as at be by for from in is it of on or the to with".split())
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class SearchIndex:
+    """In-memory BM25 inverted index over PDF metadata and extracted text.
+
+    Documents are added and removed one at a time, so uploads and deletes
+    never need a rebuild. The forward index (doc -> term frequencies) is what
+    gets persisted; postings are rebuilt from it on load.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_exam_type: Dict[str, str] = {}
+        self.doc_length: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.terms: List[str] = []  # sorted, for prefix lookups
+        self.total_length = 0
+        self.dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_terms
+
+    def add(self, doc_id: str, fields: Dict[str, Optional[str]]) -> None:
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+
+        counts: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields.get(field)):
+                counts[token] += weight
+        self._insert(doc_id, dict(counts), fields.get("exam_type") or "")
+        self.dirty = True
+
+    def _insert(self, doc_id: str, counts: Dict[str, int], exam_type: str) -> None:
+        self.doc_terms[doc_id] = counts
+        self.doc_exam_type[doc_id] = exam_type
+        length = sum(counts.values())
+        self.doc_length[doc_id] = length
+        self.total_length += length
+        for term, tf in counts.items():
+            posting = self.postings[term]
+            if not posting:
+                bisect.insort(self.terms, term)
+            posting[doc_id] = tf
+
+    def remove(self, doc_id: str) -> None:
+        counts = self.doc_terms.pop(doc_id, None)
+        if counts is None:
+            return
+        self.doc_exam_type.pop(doc_id, None)
+        self.total_length -= self.doc_length.pop(doc_id, 0)
+        for term in counts:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+                i = bisect.bisect_left(self.terms, term)
+                if i < len(self.terms) and self.terms[i] == term:
+                    del self.terms[i]
+        self.dirty = True
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        expansions = []
+        if token in self.postings:
+            expansions.append((token, 1.0))
+        i = bisect.bisect_left(self.terms, token)
+        while i < len(self.terms) and len(expansions) < MAX_PREFIX_EXPANSIONS:
+            term = self.terms[i]
+            if not term.startswith(token):
+                break
+            if term != token:
+                expansions.append((term, PREFIX_WEIGHT))
+            i += 1
+        return expansions
+
+    def search(self, query: str, exam_type: Optional[str] = None, limit: int = 20) -> List[Tuple[str, float]]:
+        """Return (doc_id, score) pairs, best first."""
+        n = len(self.doc_terms)
+        if not n:
+            return []
+        avg_length = self.total_length / n
+        scores: Dict[str, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            for term, weight in self._expand(token):
+                posting = self.postings[term]
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    if exam_type is not None and self.doc_exam_type.get(doc_id) != exam_type:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_length[doc_id] / avg_length)
+                    scores[doc_id] += weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    # Persistence
+
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with gzip.open(self.path, "rb") as f:
+                data = orjson.loads(f.read())
+        except (OSError, ValueError):
+            logger.exception("Search index at %s is unreadable, starting empty", self.path)
+            return
+        for doc_id, entry in data["docs"].items():
+            self._insert(doc_id, entry["terms"], entry["exam_type"])
+        logger.info("Loaded search index with %d documents", len(self))
+
+    def _snapshot(self) -> bytes:
+        return orjson.dumps({
+            "docs": {
+                doc_id: {"terms": terms, "exam_type": self.doc_exam_type.get(doc_id, "")}
+                for doc_id, terms in self.doc_terms.items()
+            }
+        })
+
+    def _write(self, payload: bytes) -> None:
+        # Per process, so workers saving at the same time don't write into one temporary file
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with gzip.open(tmp_path, "wb", compresslevel=5) as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    async def save(self) -> None:
+        if self.path is None or not self.dirty:
+            return
+        # Snapshot on the loop so concurrent updates can't change it mid-write
+        payload = self._snapshot()
+        self.dirty = False
+        await run_in_threadpool(self._write, payload)
+
+    async def _save_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(SEARCH_SAVE_INTERVAL)
+            try:
+                await self.save()
+            except OSError:
+                logger.exception("Failed to save search index")
+                self.dirty = True
+
+    async def start(self, db) -> None:
+        await run_in_threadpool(self.load)
+        self._save_task = asyncio.create_task(self._save_periodically())
+        self._reconcile_task = asyncio.create_task(self.reconcile(db))
+
+    async def stop(self) -> None:
+        for task in (self._save_task, self._reconcile_task):
+            if task is not None:
+                task.cancel()
+        self._save_task = self._reconcile_task = None
+        await self.save()
+
+    async def reconcile(self, db) -> None:
+        """Bring a loaded index in line with Mongo, reading only the documents it is missing.
+
+        Text is never extracted here, records without it are indexed by their
+        metadata and refreshed once the processing pipeline has extracted it.
+        """
+        seen = set()
+        async for pdf in db.pdf_documents.find({}, {"_id": 0, "id": 1}):
+            seen.add(pdf["id"])
+        for doc_id in [doc_id for doc_id in self.doc_terms if doc_id not in seen]:
+            self.remove(doc_id)
+        missing = [doc_id for doc_id in seen if doc_id not in self]
+        if missing:
+            async for pdf in db.pdf_documents.find({"id": {"$in": missing}}, {"_id": 0}):
+                if pdf["id"] not in self:
+                    self.add(pdf["id"], {**pdf, "content": pdf.get("extracted_text")})
+
+    async def sync(self, db, ids: Set[str]) -> None:
+        """Re-read the given documents after a change, possibly made by another process."""
+        found = set()
+        async for pdf in db.pdf_documents.find({"id": {"$in": list(ids)}}, {"_id": 0}):
+            found.add(pdf["id"])
+            # Without extracted text yet it is indexed by metadata, as on upload
+            if pdf.get("extracted_text") is not None or pdf["id"] not in self:
+                self.add(pdf["id"], {**pdf, "content": pdf.get("extracted_text")})
+        for doc_id in ids - found:
+            self.remove(doc_id)
+
+    async def refresh(self, pdf: dict) -> None:
+        """Re-index a PDF that is already in the index, e.g. once its text has been extracted."""
+        if pdf["id"] in self:
+            self.add(pdf["id"], {**pdf, "content": pdf.get("extracted_text")})
@@ -0,0 +1,41 @@
+from typing import Any, Dict, List, Optional, Type
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+from tracing import span
+
+
+def model_projection(model: Type[BaseModel]) -> Dict[str, int]:
+    """Mongo projection that returns exactly the fields of model, without _id."""
+    projection = {name: 1 for name in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+
+def fill_defaults(model: Type[BaseModel], docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Rows written before an optional field existed won't have it, keep the response shape stable
+    defaults = {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+    if defaults:
+        with span("model.fill_defaults", rows=len(docs)):
+            for doc in docs:
+                for name, default in defaults.items():
+                    doc.setdefault(name, default)
+    return docs
+
+
+def json_response(docs: List[Dict[str, Any]], headers: Optional[Dict[str, str]] = None) -> Response:
+    """Encode raw Mongo documents straight to a JSON response.
+
+    Routes using this keep their response_model for the OpenAPI schema, but
+    skip building a model per row and FastAPI's second validation pass. The
+    documents must already be shaped by model_projection.
+    """
+    with span("serialize.json", rows=len(docs)):
+        content = orjson.dumps(docs)
+    return Response(content=content, media_type="application/json", headers=headers)
@@ -1,46 +1,104 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-import secrets
-import shutil
+import asyncio
+
+from auth import issue_token, verify_admin, verify_admin_credentials, verify_upload_token
+from batch_writer import BatchWriter, Journal
+from blobstore import NotInBucket, create_blob_store
+from cache import create_response_cache
+from change_feed import ChangeFeed
+from compression import CompressionMiddleware
+from database import MongoDatabase
+from direct_uploads import complete_upload, create_upload, mark_completed, mark_failed, receive_upload, start_upload_sweeper
+from filestore import FileStore
+from downloads import download_cache
+from indexes import start_index_bootstrap
+from metrics import MetricsMiddleware, registry, start_event_loop_monitor
+from pagination import build_projection, fetch_page
+from pdf_processing import PENDING, ProcessingPipeline
+from ratelimit import RateLimitMiddleware, create_rate_limiter
+from search import SearchIndex
+from serialization import fill_defaults, json_response, model_projection
+from shared_state import close_redis_client
+from storage import MAX_BULK_UPLOAD_SIZE, MAX_UPLOAD_SIZE, MULTIPART_OVERHEAD, UploadSizeLimitMiddleware, release_blob, store_upload
+from tracing import TracingMiddleware, create_trace_buffer, span
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection, nothing is opened until the lifespan connects it
+mongo = MongoDatabase(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+client = mongo.client
+db = mongo.db
 
 # Create uploads directory
 UPLOAD_DIR = ROOT_DIR / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Stats, existence checks and deletes under UPLOAD_DIR, which may be a network volume
+files = FileStore()
+# PDFs, thumbnails and optimized copies, in UPLOAD_DIR or an S3 bucket (STORAGE_BACKEND)
+blob_store = create_blob_store(UPLOAD_DIR, files)
+
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Simple admin authentication
-security = HTTPBasic()
-ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')  # Simple password for admin
+# Serialized responses of the public list endpoints, invalidated by the admin writers
+response_cache = create_response_cache()
+rate_limiter = create_rate_limiter()
+trace_buffer = create_trace_buffer()
+
+# Full-text search over PDF metadata and content, updated on upload and delete
+SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH', str(ROOT_DIR / "search_index.json.gz"))
+search_index = SearchIndex(Path(SEARCH_INDEX_PATH) if SEARCH_INDEX_PATH else None)
+SEARCH_MAX_LIMIT = 100
+
+# Page count, thumbnail and text extraction run in a process pool after upload
+async def on_pdf_processed(pdf: dict):
+    # Downloads switch over to the optimized copy if one was written
+    download_cache.pop(pdf["id"])
+    await search_index.refresh(pdf)
+    await pdfs_changed(pdf["id"])
+
+processing_pipeline = ProcessingPipeline(db, blob_store, on_done=on_pdf_processed)
+
+# Writers update this node's caches right away and publish the change for the others
+async def pdfs_changed(*pdf_ids: str):
+    await response_cache.invalidate("pdfs")
+    await change_feed.publish("pdf_documents", pdf_ids)
 
-def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
-    is_correct_password = secrets.compare_digest(credentials.password, ADMIN_PASSWORD)
-    if not is_correct_password:
-        raise HTTPException(status_code=401, detail="Invalid admin credentials")
-    return credentials.username
+async def schedule_changed(*schedule_ids: str):
+    await response_cache.invalidate("schedule")
+    await change_feed.publish("class_schedules", schedule_ids)
+
+# Every node applies changes made through any node, its own included, from the change feed
+async def refresh_pdfs(pdf_ids: Optional[Set[str]]):
+    await response_cache.invalidate("pdfs")
+    if pdf_ids is None:
+        download_cache.clear()
+        await search_index.reconcile(db)
+        return
+    for pdf_id in pdf_ids:
+        download_cache.pop(pdf_id)
+    await search_index.sync(db, pdf_ids)
+
+async def refresh_schedule(schedule_ids: Optional[Set[str]]):
+    await response_cache.invalidate("schedule")
+
+change_feed = ChangeFeed(db, {"pdf_documents": refresh_pdfs, "class_schedules": refresh_schedule})
 
 # Define Models
 class PDFDocument(BaseModel):
@@ -53,6 +111,15 @@ class PDFDocument(BaseModel):
     file_path: str
     upload_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     description: Optional[str] = None
+    file_size: Optional[int] = None
+    sha256: Optional[str] = None
+    page_count: Optional[int] = None
+    has_thumbnail: bool = False
+    optimized_size: Optional[int] = None  # size of the linearized copy served for downloads
+    processing_status: Optional[str] = None  # pending, processing, done or failed
+
+class PDFSearchResult(PDFDocument):
+    score: float
 
 class PDFDocumentCreate(BaseModel):
     title: str
@@ -61,6 +128,18 @@ class PDFDocumentCreate(BaseModel):
     batch: str
     description: Optional[str] = None
 
+class PDFUploadCreate(PDFDocumentCreate):
+    filename: str
+    size: int
+    sha256: str  # hex digest of the file, checked when the upload is completed
+
+class PDFUploadTarget(BaseModel):
+    upload_id: str
+    method: str  # POST the fields plus the file as a form, or PUT the raw file
+    url: str
+    fields: Dict[str, str] = {}
+    expires_in: int
+
 class ContactMessage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -95,12 +174,68 @@ class ClassScheduleCreate(BaseModel):
     is_online: bool
     meeting_link: Optional[str] = None
 
+class BulkDeleteRequest(BaseModel):
+    ids: List[str]
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    filename: Optional[str] = None
+    status: str  # created, deleted, not_found or error
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+class AdminToken(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+# Bulk admin endpoints
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '500'))
+BULK_UPLOAD_CONCURRENCY = int(os.environ.get('BULK_UPLOAD_CONCURRENCY', '4'))
+
+def bulk_result(results: List[BulkItemResult]) -> BulkResult:
+    failed = sum(1 for r in results if r.status in ("error", "not_found"))
+    return BulkResult(succeeded=len(results) - failed, failed=failed, results=results)
+
+def check_bulk_size(count: int):
+    if count == 0:
+        raise HTTPException(status_code=400, detail="No items given")
+    if count > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per request")
+
+# Contact form submissions are acknowledged once queued and written to Mongo in batches
+CONTACT_JOURNAL_PATH = os.environ.get('CONTACT_JOURNAL_PATH', str(ROOT_DIR / "contact_journal.jsonl"))
+contact_writer = BatchWriter(
+    db.contact_messages,
+    max_batch=int(os.environ.get('CONTACT_BATCH_SIZE', '100')),
+    max_delay=float(os.environ.get('CONTACT_FLUSH_INTERVAL', '0.5')),
+    journal=Journal(Path(CONTACT_JOURNAL_PATH), fsync=os.environ.get('CONTACT_JOURNAL_FSYNC') == '1') if CONTACT_JOURNAL_PATH else None,
+    decode=lambda line: ContactMessage.model_validate_json(line).dict()
+)
+
 # Routes
 
 @api_router.get("/")
 async def root():
     return {"message": "Bipul Competitive - Government Exam Coaching API"}
 
+# Admin session, the token replaces Basic credentials on later admin calls
+@api_router.post("/admin/login", response_model=AdminToken)
+async def admin_login(admin: str = Depends(verify_admin_credentials)):
+    token, expires_in = issue_token(admin)
+    return AdminToken(access_token=token, expires_in=expires_in)
+
+# Readiness probe, 503 while Mongo is unreachable
+@api_router.get("/health")
+async def health():
+    status = await mongo.health()
+    return JSONResponse(status, status_code=200 if status["status"] == "ok" else 503)
+
 # PDF Management Routes
 @api_router.post("/admin/pdfs", response_model=PDFDocument)
 async def upload_pdf(
@@ -112,118 +247,417 @@ async def upload_pdf(
     description: Optional[str] = Form(None),
     admin: str = Depends(verify_admin)
 ):
+    pdf_doc = await store_pdf(file, title, exam_type, subject, batch, description)
+    
+    # Save to database
+    with span("mongo.insert_one", collection="pdf_documents"):
+        await db.pdf_documents.insert_one(pdf_doc.dict())
+    await pdfs_changed(pdf_doc.id)
+    start_processing(pdf_doc)
+    return pdf_doc
+
+async def store_pdf(
+    file: UploadFile,
+    title: str,
+    exam_type: str,
+    subject: str,
+    batch: str,
+    description: Optional[str]
+) -> PDFDocument:
     # Validate file type
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Generate unique filename
-    file_id = str(uuid.uuid4())
-    file_extension = ".pdf"
-    unique_filename = f"{file_id}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream the file to disk in chunks and store it under its SHA-256,
+    # identical uploads share one file on disk
+    stored = await store_upload(db, file, blob_store)
     
     # Create PDF document record
+    with span("model.build"):
+        return PDFDocument(
+            title=title,
+            exam_type=exam_type,
+            subject=subject,
+            batch=batch,
+            filename=file.filename,
+            file_path=stored.location,
+            description=description,
+            file_size=stored.size,
+            sha256=stored.sha256,
+            processing_status=PENDING
+        )
+
+def start_processing(pdf_doc: PDFDocument):
+    # Searchable by metadata right away, the extracted text is added when processing finishes
+    search_index.add(pdf_doc.id, pdf_doc.dict())
+    processing_pipeline.submit(pdf_doc.dict())
+
+async def remove_pdf_file(pdf_doc: dict):
+    download_cache.pop(pdf_doc["id"])
+    search_index.remove(pdf_doc["id"])
+    
+    # Delete file from filesystem, shared blobs are only removed with their last record
+    if pdf_doc.get("sha256"):
+        removed = await release_blob(db, pdf_doc["sha256"], blob_store)
+    else:
+        await blob_store.delete(pdf_doc["file_path"])
+        removed = True
+    
+    # Thumbnails and optimized copies are shared the same way as the file they were made from
+    if removed:
+        await blob_store.delete(processing_pipeline.thumbnail_location(pdf_doc))
+        await blob_store.delete(processing_pipeline.optimized_location(pdf_doc))
+
+# Direct uploads: the browser sends the file straight to storage, so large
+# files don't pass through the API worker (or only through the PUT handler
+# below with local storage), then completes the upload to create the record
+@api_router.post("/admin/pdfs/uploads", response_model=PDFUploadTarget)
+async def create_pdf_upload(upload: PDFUploadCreate, admin: str = Depends(verify_admin)):
+    metadata = PDFDocumentCreate(**upload.dict()).dict()
+    return await create_upload(
+        db, blob_store, metadata, upload.filename, upload.size, upload.sha256,
+        local_url=lambda upload_id: app.url_path_for("receive_pdf_upload", upload_id=upload_id)
+    )
+
+@api_router.put("/uploads/{upload_id}", status_code=204)
+async def receive_pdf_upload(upload_id: str, request: Request, token: str = Query(...)):
+    # Authorised by the signed URL rather than admin credentials, the body is streamed to staging
+    verify_upload_token(token, upload_id)
+    await receive_upload(db, blob_store, upload_id, request.stream(), request.headers.get("content-length"))
+    return Response(status_code=204)
+
+@api_router.post("/admin/pdfs/uploads/{upload_id}/complete", response_model=PDFDocument)
+async def complete_pdf_upload(upload_id: str, admin: str = Depends(verify_admin)):
+    upload, location = await complete_upload(db, blob_store, upload_id)
     pdf_doc = PDFDocument(
-        title=title,
-        exam_type=exam_type,
-        subject=subject,
-        batch=batch,
-        filename=file.filename,
-        file_path=str(file_path),
-        description=description
+        **upload["metadata"],
+        filename=upload["filename"],
+        file_path=location,
+        file_size=upload["size"],
+        sha256=upload["sha256"],
+        processing_status=PENDING
     )
-    
-    # Save to database
-    await db.pdf_documents.insert_one(pdf_doc.dict())
+    try:
+        await db.pdf_documents.insert_one(pdf_doc.dict())
+    except Exception as e:
+        # The staged file has moved into the blob store, the upload can't be completed again
+        await release_blob(db, pdf_doc.sha256, blob_store)
+        await mark_failed(db, upload_id, f"creating the PDF record failed: {e}")
+        raise
+    await mark_completed(db, upload_id, pdf_doc.id)
+    await pdfs_changed(pdf_doc.id)
+    start_processing(pdf_doc)
     return pdf_doc
 
+@api_router.post("/admin/pdfs/bulk", response_model=BulkResult)
+async def bulk_upload_pdfs(
+    files: List[UploadFile] = File(...),
+    exam_type: str = Form(...),
+    subject: str = Form(...),
+    batch: str = Form(...),
+    titles: List[str] = Form([]),
+    description: Optional[str] = Form(None),
+    admin: str = Depends(verify_admin)
+):
+    # Titles are matched to files by position, files without one are titled after the filename
+    check_bulk_size(len(files))
+    semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+    
+    async def store_one(index: int, file: UploadFile):
+        title = titles[index] if index < len(titles) and titles[index] else Path(file.filename).stem
+        async with semaphore:
+            try:
+                return await store_pdf(file, title, exam_type, subject, batch, description)
+            except HTTPException as e:
+                return BulkItemResult(index=index, filename=file.filename, status="error", detail=e.detail)
+            except Exception as e:
+                # Reported per file, raising would leak the references the other files took
+                logger.exception("Storing bulk upload %s failed", file.filename)
+                return BulkItemResult(index=index, filename=file.filename, status="error", detail=str(e))
+
+    stored = await asyncio.gather(*(store_one(i, f) for i, f in enumerate(files)))
+    pdf_docs = [doc for doc in stored if isinstance(doc, PDFDocument)]
+    if pdf_docs:
+        try:
+            await db.pdf_documents.insert_many([doc.dict() for doc in pdf_docs])
+        except Exception:
+            # Nothing was recorded, give the blob references back
+            await asyncio.gather(*(release_blob(db, doc.sha256, blob_store) for doc in pdf_docs))
+            raise
+        await pdfs_changed(*(doc.id for doc in pdf_docs))
+        for doc in pdf_docs:
+            start_processing(doc)
+    
+    results = [
+        BulkItemResult(index=i, id=item.id, filename=item.filename, status="created")
+        if isinstance(item, PDFDocument) else item
+        for i, item in enumerate(stored)
+    ]
+    return bulk_result(results)
+
+async def list_pdfs(query: dict, limit: Optional[int], cursor: Optional[str], fields: Optional[str]) -> Response:
+    # Keyset pagination, the next page cursor is returned in the X-Next-Cursor header
+    projection = build_projection(fields, list(PDFDocument.model_fields))
+    pdfs, next_cursor = await fetch_page(
+        db.pdf_documents, query, limit, cursor, projection or model_projection(PDFDocument)
+    )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    # Rows are projected to the model fields in Mongo and encoded without building models
+    if not projection:
+        fill_defaults(PDFDocument, pdfs)
+    return json_response(pdfs, headers)
+
 @api_router.get("/pdfs", response_model=List[PDFDocument])
-async def get_all_pdfs():
-    pdfs = await db.pdf_documents.find().sort("upload_date", -1).to_list(length=None)
-    return [PDFDocument(**pdf) for pdf in pdfs]
+async def get_all_pdfs(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    return await response_cache.get_or_build(
+        "pdfs", request, lambda: list_pdfs({}, limit, cursor, fields)
+    )
 
 @api_router.get("/pdfs/exam/{exam_type}", response_model=List[PDFDocument])
-async def get_pdfs_by_exam(exam_type: str):
-    pdfs = await db.pdf_documents.find({"exam_type": exam_type}).sort("upload_date", -1).to_list(length=None)
-    return [PDFDocument(**pdf) for pdf in pdfs]
+async def get_pdfs_by_exam(
+    exam_type: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    return await response_cache.get_or_build(
+        "pdfs", request, lambda: list_pdfs({"exam_type": exam_type}, limit, cursor, fields)
+    )
 
-@api_router.get("/pdfs/download/{pdf_id}")
-async def download_pdf(pdf_id: str):
-    pdf_doc = await db.pdf_documents.find_one({"id": pdf_id})
+@api_router.get("/pdfs/search", response_model=List[PDFSearchResult])
+async def search_pdfs(
+    q: str = Query(..., min_length=1),
+    exam_type: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT)
+):
+    # BM25 over title, subject, batch, description and PDF text, query words also match as prefixes
+    ranked = search_index.search(q, exam_type=exam_type, limit=limit)
+    if not ranked:
+        return json_response([])
+    
+    pdfs = await db.pdf_documents.find(
+        {"id": {"$in": [doc_id for doc_id, _ in ranked]}}, model_projection(PDFDocument)
+    ).to_list(length=None)
+    by_id = {pdf["id"]: pdf for pdf in fill_defaults(PDFDocument, pdfs)}
+    return json_response([
+        {**by_id[doc_id], "score": round(score, 4)} for doc_id, score in ranked if doc_id in by_id
+    ])
+
+@api_router.get("/pdfs/{pdf_id}/thumbnail")
+async def get_pdf_thumbnail(pdf_id: str):
+    pdf_doc = await db.pdf_documents.find_one({"id": pdf_id}, {"_id": 0, "id": 1, "sha256": 1, "has_thumbnail": 1})
     if not pdf_doc:
         raise HTTPException(status_code=404, detail="PDF not found")
+    if not pdf_doc.get("has_thumbnail"):
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
     
-    file_path = Path(pdf_doc["file_path"])
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found on server")
-    
-    return FileResponse(
-        path=file_path,
-        filename=pdf_doc["filename"],
-        media_type="application/pdf"
+    # A PDF's content never changes, so its thumbnail can be cached for good
+    response = await blob_store.file_response(
+        processing_pipeline.thumbnail_location(pdf_doc),
+        media_type="image/jpeg",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
     )
+    if response is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return response
+
+@api_router.get("/pdfs/download/{pdf_id}")
+async def download_pdf(pdf_id: str, request: Request):
+    # Repeat downloads are served from the in-process cache without a Mongo round trip
+    info = download_cache.get(pdf_id)
+    if info is None:
+        with span("mongo.find_one", collection="pdf_documents"):
+            pdf_doc = await db.pdf_documents.find_one({"id": pdf_id}, {"_id": 0, "extracted_text": 0})
+        if not pdf_doc:
+            raise HTTPException(status_code=404, detail="PDF not found")
+        
+        with span("file.stat"):
+            try:
+                info = await blob_store.download_info(pdf_doc)
+            except NotInBucket:
+                raise HTTPException(
+                    status_code=409,
+                    detail="File is still in local storage, run `python storage.py s3` to move it to the bucket"
+                )
+        if info is None:
+            raise HTTPException(status_code=404, detail="File not found on server")
+        download_cache.set(pdf_id, info)
+    
+    # From local disk: handles If-None-Match/If-Modified-Since (304) and Range requests (206),
+    # or hands the file to the reverse proxy when PDF_DELIVERY_MODE is set.
+    # From S3: a redirect to a short-lived presigned URL.
+    return blob_store.download_response(request, info)
 
 @api_router.delete("/admin/pdfs/{pdf_id}")
 async def delete_pdf(pdf_id: str, admin: str = Depends(verify_admin)):
-    pdf_doc = await db.pdf_documents.find_one({"id": pdf_id})
+    # Delete the record first, of two overlapping deletes only the one that removed it releases the blob
+    pdf_doc = await db.pdf_documents.find_one_and_delete({"id": pdf_id}, {"_id": 0})
     if not pdf_doc:
         raise HTTPException(status_code=404, detail="PDF not found")
     
-    # Delete file from filesystem
-    file_path = Path(pdf_doc["file_path"])
-    if file_path.exists():
-        file_path.unlink()
-    
-    # Delete from database
-    await db.pdf_documents.delete_one({"id": pdf_id})
+    await remove_pdf_file(pdf_doc)
+    await pdfs_changed(pdf_id)
     return {"message": "PDF deleted successfully"}
 
+@api_router.post("/admin/pdfs/bulk-delete", response_model=BulkResult)
+async def bulk_delete_pdfs(request: BulkDeleteRequest, admin: str = Depends(verify_admin)):
+    check_bulk_size(len(request.ids))
+    # One delete per id, so only the records this call removed have their blobs released
+    projection = {"_id": 0, "id": 1, "file_path": 1, "sha256": 1}
+    pdf_docs = await asyncio.gather(*(
+        db.pdf_documents.find_one_and_delete({"id": pdf_id}, projection) for pdf_id in dict.fromkeys(request.ids)
+    ))
+    found = {doc["id"]: doc for doc in pdf_docs if doc is not None}
+    
+    if found:
+        await pdfs_changed(*found)
+    
+    # Unlink files concurrently once the records are gone
+    outcomes = await asyncio.gather(*(remove_pdf_file(doc) for doc in found.values()), return_exceptions=True)
+    errors = {doc["id"]: outcome for doc, outcome in zip(found.values(), outcomes) if isinstance(outcome, Exception)}
+    
+    results = []
+    for index, pdf_id in enumerate(request.ids):
+        if pdf_id not in found:
+            results.append(BulkItemResult(index=index, id=pdf_id, status="not_found"))
+        elif pdf_id in errors:
+            results.append(BulkItemResult(index=index, id=pdf_id, status="error", detail=f"Record deleted but file removal failed: {errors[pdf_id]}"))
+        else:
+            results.append(BulkItemResult(index=index, id=pdf_id, status="deleted"))
+    return bulk_result(results)
+
 # Contact Management Routes
 @api_router.post("/contact", response_model=ContactMessage)
 async def submit_contact_form(contact: ContactMessageCreate):
     contact_msg = ContactMessage(**contact.dict())
-    await db.contact_messages.insert_one(contact_msg.dict())
+    await contact_writer.enqueue(contact_msg.dict(), contact_msg.model_dump_json())
     return contact_msg
 
 @api_router.get("/admin/contacts", response_model=List[ContactMessage])
 async def get_contact_messages(admin: str = Depends(verify_admin)):
-    contacts = await db.contact_messages.find().sort("timestamp", -1).to_list(length=None)
-    return [ContactMessage(**contact) for contact in contacts]
+    contacts = await db.contact_messages.find({}, model_projection(ContactMessage)).sort("timestamp", -1).to_list(length=None)
+    return json_response(fill_defaults(ContactMessage, contacts))
 
 # Class Schedule Routes
 @api_router.post("/admin/schedule", response_model=ClassSchedule)
 async def create_class_schedule(schedule: ClassScheduleCreate, admin: str = Depends(verify_admin)):
     class_schedule = ClassSchedule(**schedule.dict())
     await db.class_schedules.insert_one(class_schedule.dict())
+    await schedule_changed(class_schedule.id)
     return class_schedule
 
+@api_router.post("/admin/schedule/bulk", response_model=BulkResult)
+async def bulk_create_class_schedules(schedules: List[ClassScheduleCreate], admin: str = Depends(verify_admin)):
+    check_bulk_size(len(schedules))
+    class_schedules = [ClassSchedule(**schedule.dict()) for schedule in schedules]
+    await db.class_schedules.insert_many([schedule.dict() for schedule in class_schedules])
+    await schedule_changed(*(schedule.id for schedule in class_schedules))
+    return bulk_result([
+        BulkItemResult(index=i, id=schedule.id, status="created")
+        for i, schedule in enumerate(class_schedules)
+    ])
+
+@api_router.post("/admin/schedule/bulk-delete", response_model=BulkResult)
+async def bulk_delete_class_schedules(request: BulkDeleteRequest, admin: str = Depends(verify_admin)):
+    check_bulk_size(len(request.ids))
+    existing = await db.class_schedules.distinct("id", {"id": {"$in": request.ids}})
+    if existing:
+        await db.class_schedules.delete_many({"id": {"$in": existing}})
+        await schedule_changed(*existing)
+    
+    found = set(existing)
+    return bulk_result([
+        BulkItemResult(index=i, id=schedule_id, status="deleted" if schedule_id in found else "not_found")
+        for i, schedule_id in enumerate(request.ids)
+    ])
+
+async def list_class_schedules() -> Response:
+    schedules = await db.class_schedules.find({}, model_projection(ClassSchedule)).to_list(length=None)
+    return json_response(fill_defaults(ClassSchedule, schedules))
+
 @api_router.get("/schedule", response_model=List[ClassSchedule])
-async def get_class_schedules():
-    schedules = await db.class_schedules.find().to_list(length=None)
-    return [ClassSchedule(**schedule) for schedule in schedules]
+async def get_class_schedules(request: Request):
+    return await response_cache.get_or_build("schedule", request, list_class_schedules)
 
 @api_router.delete("/admin/schedule/{schedule_id}")
 async def delete_class_schedule(schedule_id: str, admin: str = Depends(verify_admin)):
     result = await db.class_schedules.delete_one({"id": schedule_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Schedule not found")
+    await schedule_changed(schedule_id)
     return {"message": "Schedule deleted successfully"}
 
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(admin: str = Depends(verify_admin)):
+    return response_cache.stats()
+
+@api_router.get("/admin/ratelimit/stats")
+async def get_rate_limit_stats(admin: str = Depends(verify_admin)):
+    return rate_limiter.stats()
+
+@api_router.get("/admin/traces")
+async def get_slow_traces(limit: int = Query(50, ge=1, le=1000), admin: str = Depends(verify_admin)):
+    # Requests slower than TRACE_SLOW_MS, newest first
+    return {**trace_buffer.stats(), "traces": trace_buffer.recent(limit)}
+
+@api_router.get("/admin/processing/stats")
+async def get_processing_stats(admin: str = Depends(verify_admin)):
+    return processing_pipeline.stats()
+
+@api_router.get("/admin/files/stats")
+async def get_file_stats(admin: str = Depends(verify_admin)):
+    return blob_store.stats()
+
+@api_router.get("/admin/changes/stats")
+async def get_change_feed_stats(admin: str = Depends(verify_admin)):
+    return change_feed.stats()
+
+@api_router.get("/admin/contacts/queue")
+async def get_contact_queue_stats(admin: str = Depends(verify_admin)):
+    return contact_writer.stats()
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Outside /api so the public proxy doesn't expose it, scrape the app port directly
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Cached lists arrive precompressed, this covers everything else that is text
+app.add_middleware(CompressionMiddleware)
+
+# Oversized multipart uploads are refused before the form parser spools them to disk
+app.add_middleware(UploadSizeLimitMiddleware, limits={
+    "/api/admin/pdfs": MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+    "/api/admin/pdfs/bulk": MAX_BULK_UPLOAD_SIZE,
+})
+
+# Outside compression so rejected requests cost as little as possible
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache", "ETag", "Content-Range", "Accept-Ranges", "Retry-After", "X-Request-ID"],
 )
 
+# Outermost, so latency covers every other middleware and rate limited requests are counted
+app.add_middleware(MetricsMiddleware)
+
+# Request IDs and per-request traces, slow requests are kept for /api/admin/traces
+app.add_middleware(TracingMiddleware, buffer=trace_buffer)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -231,6 +665,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await mongo.connect()
+    app.state.index_task = start_index_bootstrap(db)
+    app.state.loop_monitor = start_event_loop_monitor()
+    app.state.upload_sweeper = start_upload_sweeper(db, blob_store)
+    if trace_buffer.exporter is not None:
+        trace_buffer.exporter.start()
+    await contact_writer.start()
+    await search_index.start(db)
+    change_feed.start()
+    processing_pipeline.start()
+    await processing_pipeline.resume()
+
+    yield
+
+    app.state.loop_monitor.cancel()
+    app.state.upload_sweeper.cancel()
+    if trace_buffer.exporter is not None:
+        await trace_buffer.exporter.stop()
+    await contact_writer.stop()
+    await processing_pipeline.stop()
+    await change_feed.stop()
+    await search_index.stop()
+    await close_redis_client()
+    files.close()
+    mongo.close()
+
+app.router.lifespan_context = lifespan
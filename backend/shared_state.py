@@ -0,0 +1,32 @@
+import os
+
+# Where state that has to agree across workers lives, the default for the
+# response cache and rate limiter backends. "memory" keeps it in each process,
+# "redis" shares it through REDIS_URL and is what multi-worker deployments want.
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'memory').lower()
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+_redis_client = None
+
+
+def redis_client(setting: str = "STATE_BACKEND=redis"):
+    """The Redis client shared by every cache and limiter in this process.
+
+    redis.asyncio only connects on first use, so this is safe to call while
+    importing the app in a gunicorn master that forks workers afterwards.
+    """
+    global _redis_client
+    if _redis_client is None:
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(f"{setting} requires the redis package") from e
+        _redis_client = redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+async def close_redis_client() -> None:
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
@@ -0,0 +1,356 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import orjson
+from fastapi import HTTPException, UploadFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from blobstore import blob_name, hash_file, place_file
+from filestore import FileStore
+from metrics import pdf_bytes_uploaded
+from pdf_processing import FAILED, PENDING
+from tracing import span
+
+# Uploads are read in fixed-size chunks so memory use doesn't grow with the file
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_MB', '200')) * 1024 * 1024
+# Whole request bodies of bulk uploads, which carry many files
+MAX_BULK_UPLOAD_SIZE = int(os.environ.get('MAX_BULK_UPLOAD_MB', '2048')) * 1024 * 1024
+# Room for the other form fields and part headers next to the file
+MULTIPART_OVERHEAD = 1024 * 1024
+# A blob claimed for deletion longer ago than this is taken over by the next
+# upload of the same content, so a process that died mid-delete can't block it
+BLOB_DELETE_LEASE = float(os.environ.get('BLOB_DELETE_LEASE', '60'))
+BLOB_DELETE_POLL_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+# Serialises reference count changes and file moves for the same blob in this
+# process, the deleting claim on the pdf_blobs record covers other processes
+_blob_locks: Dict[str, asyncio.Lock] = {}
+# Tasks holding or waiting for each lock, a lock is dropped when the last one leaves
+_blob_lock_users: Counter = Counter()
+
+
+@dataclass
+class StoredFile:
+    path: Path
+    size: int
+    sha256: str
+    # Where the blob store keeps it, set by store_upload
+    location: Optional[str] = None
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE // (1024 * 1024)} MB"
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """Refuses upload request bodies over a per-path limit while they are received.
+
+    Starlette parses a multipart body into temporary files before the handler
+    runs, so save_upload only sees the size once the whole body is in. This
+    answers 413 up front when Content-Length is over the limit, and stops
+    reading a body without one as soon as it passes the limit.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds the limit of {limit // (1024 * 1024)} MB"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            body = orjson.dumps({"detail": detail})
+            headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            await send({"type": "http.response.start", "status": 413, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Surfaces through the form parser as the route's response
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _write_chunk(buffer, hasher, chunk: bytes) -> None:
+    # hashlib releases the GIL for large buffers, so hash alongside the write
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+
+def blob_path(root: Path, sha256: str) -> Path:
+    return root / blob_name(sha256)
+
+
+async def _read_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def save_upload(file: UploadFile, dest_dir: Path, files: FileStore) -> StoredFile:
+    """Stream an upload into dest_dir without blocking the event loop.
+
+    The body is written to a temporary file in dest_dir and hashed as it is
+    read. The returned StoredFile points at the temporary file until
+    store_upload hands it to the blob store. Oversized request bodies are
+    already refused by UploadSizeLimitMiddleware while they arrive.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise _too_large()
+    return await save_stream(_read_chunks(file), dest_dir, files)
+
+
+async def save_stream(
+    chunks: AsyncIterator[bytes],
+    dest_dir: Path,
+    files: FileStore,
+    max_size: int = MAX_UPLOAD_SIZE,
+    too_large: Callable[[], HTTPException] = _too_large,
+) -> StoredFile:
+    """Write and hash a stream of chunks into a temporary file in dest_dir, on the file I/O threads."""
+    tmp_path = dest_dir / f".{uuid.uuid4()}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    buffer = await files.run(open, tmp_path, "wb")
+    try:
+        with span("file.write"):
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise too_large()
+                await files.run(_write_chunk, buffer, hasher, chunk)
+            await files.run(buffer.close)
+        pdf_bytes_uploaded.inc(amount=size)
+    except BaseException:
+        await files.run(buffer.close)
+        await files.unlink(tmp_path)
+        raise
+
+    return StoredFile(path=tmp_path, size=size, sha256=hasher.hexdigest())
+
+
+@asynccontextmanager
+async def _blob_lock(sha256: str) -> AsyncIterator[None]:
+    lock = _blob_locks.setdefault(sha256, asyncio.Lock())
+    _blob_lock_users[sha256] += 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _blob_lock_users[sha256] -= 1
+        if not _blob_lock_users[sha256]:
+            del _blob_lock_users[sha256]
+            del _blob_locks[sha256]
+
+
+async def _reference_blob(db, sha256: str, location: str, size: int) -> None:
+    """Take a reference on a blob record, waiting while another process deletes the blob."""
+    while True:
+        try:
+            # A record being deleted doesn't match, the upsert then hits the unique index
+            await db.pdf_blobs.update_one(
+                {"sha256": sha256, "deleting": None},
+                {"$inc": {"ref_count": 1}, "$setOnInsert": {"path": location, "size": size}},
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            pass
+        expired = datetime.now(timezone.utc) - timedelta(seconds=BLOB_DELETE_LEASE)
+        result = await db.pdf_blobs.update_one(
+            {"sha256": sha256, "deleting": {"$lt": expired}},
+            {"$set": {"deleting": None}, "$inc": {"ref_count": 1}}
+        )
+        if result.modified_count:
+            # The file may be gone, the caller places it again
+            return
+        await asyncio.sleep(BLOB_DELETE_POLL_INTERVAL)
+
+
+async def add_blob(db, store, sha256: str, size: int, place: Callable[[str], Awaitable[None]]) -> str:
+    """Take a reference on the blob for sha256 and have place() put the content at its location."""
+    location = store.location(blob_name(sha256))
+    async with _blob_lock(sha256):
+        # Take the reference before the file appears so a concurrent release can't unlink it
+        with span("mongo.update_one", collection="pdf_blobs"):
+            await _reference_blob(db, sha256, location, size)
+        try:
+            with span("file.place_blob", backend=store.kind):
+                await place(location)
+        except BaseException:
+            await db.pdf_blobs.update_one({"sha256": sha256}, {"$inc": {"ref_count": -1}})
+            raise
+    return location
+
+
+async def store_upload(db, file: UploadFile, store) -> StoredFile:
+    """Save an upload into the content-addressed store and take a reference on its blob."""
+    stored = await save_upload(file, store.spool_dir, store.files)
+    try:
+        stored.location = await add_blob(
+            db, store, stored.sha256, stored.size, lambda location: store.put(stored.path, location)
+        )
+    except BaseException:
+        await store.files.unlink(stored.path)
+        raise
+    return stored
+
+
+async def release_blob(db, sha256: str, store) -> bool:
+    """Drop a reference on a blob, deleting it from the store when it was the last one.
+
+    Returns True if the blob was removed.
+    """
+    async with _blob_lock(sha256):
+        blob = await db.pdf_blobs.find_one_and_update(
+            {"sha256": sha256},
+            {"$inc": {"ref_count": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is None or blob["ref_count"] > 0:
+            return False
+        # Claim the delete before unlinking, add_blob in other processes waits for it
+        # instead of taking a reference on a file that is about to disappear
+        claimed_at = datetime.now(timezone.utc).replace(microsecond=0)
+        claimed = await db.pdf_blobs.update_one(
+            {"sha256": sha256, "ref_count": {"$lte": 0}, "deleting": None},
+            {"$set": {"deleting": claimed_at}}
+        )
+        if not claimed.modified_count:
+            # Referenced again in the meantime
+            return False
+        try:
+            await store.delete(blob["path"])
+        except BaseException:
+            await db.pdf_blobs.update_one({"sha256": sha256, "deleting": claimed_at}, {"$set": {"deleting": None}})
+            raise
+        await db.pdf_blobs.delete_one({"sha256": sha256, "deleting": claimed_at})
+    return True
+
+
+async def migrate_legacy_uploads(db, dest_dir: Path) -> int:
+    """Move records stored under per-upload UUID names into the content-addressed store."""
+    migrated = 0
+    async for pdf in db.pdf_documents.find({"sha256": None}):
+        legacy_path = Path(pdf["file_path"])
+        if not legacy_path.exists():
+            logger.warning("Skipping %s, file %s is missing", pdf["id"], legacy_path)
+            continue
+        digest = await run_in_threadpool(hash_file, legacy_path)
+        final_path = blob_path(dest_dir, digest)
+        async with _blob_lock(digest):
+            await _reference_blob(db, digest, str(final_path), legacy_path.stat().st_size)
+            await run_in_threadpool(place_file, legacy_path, final_path)
+        await db.pdf_documents.update_one(
+            {"id": pdf["id"]},
+            {
+                "$set": {"file_path": str(final_path), "sha256": digest, "file_size": final_path.stat().st_size},
+                # The optimized copy was named after the old path, drop it so downloads fall back to the blob
+                "$unset": {"optimized_path": "", "optimized_size": ""},
+            }
+        )
+        if pdf.get("optimized_path"):
+            Path(pdf["optimized_path"]).unlink(missing_ok=True)
+        migrated += 1
+    return migrated
+
+
+async def migrate_to_s3(db, store, local_root: Path) -> int:
+    """Copy the blobs kept under local_root into an S3BlobStore's bucket and point their records at it.
+
+    Records without a hash are skipped, migrate_legacy_uploads handles those
+    first. Thumbnails and optimized copies are copied along. The local files
+    are left in place, remove them once the bucket is serving.
+    """
+    migrated = 0
+    async for blob in db.pdf_blobs.find({"path": {"$not": {"$regex": "^s3://"}}, "deleting": None}):
+        sha256, source = blob["sha256"], Path(blob["path"])
+        if not source.exists():
+            logger.warning("Skipping blob %s, file %s is missing", sha256, source)
+            continue
+        location = store.location(blob_name(sha256))
+        async with _blob_lock(sha256):
+            if not await store.exists(location):
+                await store.upload(source, location)
+            await db.pdf_blobs.update_one({"sha256": sha256, "path": blob["path"]}, {"$set": {"path": location}})
+
+        # Named like ProcessingPipeline.thumbnail_location and optimized_location name them
+        thumbnail = local_root / "thumbnails" / f"{sha256}.jpg"
+        if thumbnail.exists():
+            await store.upload(thumbnail, store.location(f"thumbnails/{sha256}.jpg"), "image/jpeg")
+        optimized = source.with_suffix(".web.pdf")
+        update: Dict[str, Dict[str, str]] = {"$set": {"file_path": location}}
+        if optimized.exists():
+            update["$set"]["optimized_path"] = f"{os.path.splitext(location)[0]}.web.pdf"
+            await store.upload(optimized, update["$set"]["optimized_path"])
+        else:
+            update["$unset"] = {"optimized_path": "", "optimized_size": ""}
+        await db.pdf_documents.update_many({"sha256": sha256}, update)
+        # Jobs that ran in S3 mode before the move couldn't read the file, run them again
+        await db.pdf_documents.update_many(
+            {"sha256": sha256, "processing_status": FAILED}, {"$set": {"processing_status": PENDING}}
+        )
+        migrated += 1
+    return migrated
+
+
+if __name__ == "__main__":
+    # One-off migrations of existing uploads: python storage.py, then with
+    # STORAGE_BACKEND=s3 set, python storage.py s3 to move them to the bucket
+    import sys
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    ROOT_DIR = Path(__file__).parent
+    load_dotenv(ROOT_DIR / '.env')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        migrated = await migrate_legacy_uploads(db, ROOT_DIR / "uploads")
+        print(f"Migrated {migrated} PDF records to content-addressed storage")
+        if sys.argv[1:] == ["s3"]:
+            from blobstore import S3_BUCKET, S3BlobStore
+
+            store = S3BlobStore(S3_BUCKET, FileStore())
+            migrated = await migrate_to_s3(db, store, ROOT_DIR / "uploads")
+            print(f"Copied {migrated} blobs to s3://{S3_BUCKET}")
+            store.files.close()
+        client.close()
+
+    asyncio.run(main())
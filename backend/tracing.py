@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import secrets
+import time
+import urllib.request
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Every request is traced, only those slower than this are kept (tail sampling)
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '500'))
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', '200'))
+# e.g. http://localhost:4318 for a local OpenTelemetry collector, empty disables export
+OTLP_ENDPOINT = os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT', '')
+OTLP_SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'bipul-api')
+OTLP_EXPORT_INTERVAL = float(os.environ.get('OTLP_EXPORT_INTERVAL', '5'))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+TRACE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = self.start_ns
+        self.attributes = attributes
+
+
+class Trace:
+    """One request: a root span plus every span opened while handling it."""
+
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.trace_id = request_id if TRACE_ID_RE.match(request_id) else uuid.uuid4().hex
+        self.wall_start_ns = time.time_ns()
+        self.root = Span(f"{method} {path}", None, {"http.method": method, "http.target": path})
+        self.spans: List[Span] = []
+        self.status = 0
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.root.end_ns - self.root.start_ns) / 1_000_000
+
+    def to_dict(self) -> Dict[str, Any]:
+        def offset_ms(ns: int) -> float:
+            return round((ns - self.root.start_ns) / 1_000_000, 3)
+
+        return {
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "status": self.status,
+            "started": self.wall_start_ns / 1_000_000_000,
+            "duration_ms": round(self.duration_ms, 3),
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": offset_ms(span.start_ns),
+                    "duration_ms": round((span.end_ns - span.start_ns) / 1_000_000, 3),
+                    "parent": span.parent_id if span.parent_id != self.root.span_id else None,
+                    "id": span.span_id,
+                    **({"attributes": span.attributes} if span.attributes else {}),
+                }
+                for span in self.spans
+            ],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Time a block as part of the current request, a no-op outside of one.
+
+    Works around awaits as well, the span covers the wall time of the block.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    current = Span(name, _current_span.get() or trace.root.span_id, attributes)
+    token = _current_span.set(current.span_id)
+    try:
+        yield
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.end_ns = time.perf_counter_ns()
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+class OTLPExporter:
+    """Posts sampled traces to an OTLP/HTTP collector as JSON, in batches."""
+
+    def __init__(self, endpoint: str, service_name: str = OTLP_SERVICE_NAME, interval: float = OTLP_EXPORT_INTERVAL):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.interval = interval
+        self._pending: Deque[Trace] = deque(maxlen=1000)
+        self._task: Optional[asyncio.Task] = None
+        self.exported = 0
+        self.failures = 0
+
+    def add(self, trace: Trace) -> None:
+        self._pending.append(trace)
+
+    def _otlp_span(self, trace: Trace, span: Span) -> Dict[str, Any]:
+        def unix_ns(ns: int) -> str:
+            return str(trace.wall_start_ns + ns - trace.root.start_ns)
+
+        otlp = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 2 if span is trace.root else 1,  # SERVER for the request, INTERNAL otherwise
+            "startTimeUnixNano": unix_ns(span.start_ns),
+            "endTimeUnixNano": unix_ns(span.end_ns),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in span.attributes.items()],
+        }
+        if span.parent_id:
+            otlp["parentSpanId"] = span.parent_id
+        return otlp
+
+    def _payload(self, traces: List[Trace]) -> bytes:
+        spans = [self._otlp_span(t, s) for t in traces for s in [t.root, *t.spans]]
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+            }]
+        }).encode()
+
+    def _post(self, payload: bytes) -> None:
+        request = urllib.request.Request(
+            self.url, data=payload, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        traces = list(self._pending)
+        self._pending.clear()
+        try:
+            await run_in_threadpool(self._post, self._payload(traces))
+            self.exported += len(traces)
+        except Exception as e:
+            # Collector down, drop the batch rather than grow without bound
+            logger.warning("OTLP export to %s failed: %s", self.url, e)
+            self.failures += 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+class TraceBuffer:
+    """Ring buffer of the most recent slow requests."""
+
+    def __init__(self, maxlen: int = TRACE_BUFFER_SIZE, slow_ms: float = TRACE_SLOW_MS, exporter: Optional[OTLPExporter] = None):
+        self.traces: Deque[Trace] = deque(maxlen=maxlen)
+        self.slow_ms = slow_ms
+        self.exporter = exporter
+        self.seen = 0
+
+    def finish(self, trace: Trace) -> None:
+        self.seen += 1
+        if trace.duration_ms < self.slow_ms:
+            return
+        self.traces.append(trace)
+        if self.exporter is not None:
+            self.exporter.add(trace)
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        return [trace.to_dict() for trace in list(self.traces)[::-1][:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.slow_ms,
+            "requests": self.seen,
+            "sampled": len(self.traces),
+            "exporter": None if self.exporter is None else {
+                "url": self.exporter.url,
+                "exported": self.exporter.exported,
+                "failures": self.exporter.failures,
+            },
+        }
+
+
+class TracingMiddleware:
+    """Gives every request an ID (kept from X-Request-ID if the client sent one) and a trace."""
+
+    def __init__(self, app: ASGIApp, buffer: TraceBuffer):
+        self.app = app
+        self.buffer = buffer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER)
+        if not request_id or not REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        trace = Trace(request_id, scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = [*message["headers"], (b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            trace.root.end_ns = time.perf_counter_ns()
+            trace.root.attributes["http.status_code"] = trace.status
+            _current_trace.reset(token)
+            self.buffer.finish(trace)
+
+
+def create_trace_buffer() -> TraceBuffer:
+    return TraceBuffer(exporter=OTLPExporter(OTLP_ENDPOINT) if OTLP_ENDPOINT else None)
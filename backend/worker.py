@@ -0,0 +1,22 @@
+import os
+
+from uvicorn.workers import UvicornWorker
+
+# Seconds of gunicorn's graceful_timeout kept back from in-flight requests for
+# the app's own shutdown: flushing the contact queue and closing clients
+SHUTDOWN_RESERVE = int(os.environ.get('SHUTDOWN_RESERVE', '5'))
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    """Uvicorn worker that drains within gunicorn's graceful timeout.
+
+    On SIGTERM, or when a reload (SIGHUP) retires it, the worker stops
+    accepting connections and lets in-flight downloads and uploads finish.
+    The stock worker waits for them without a limit, so a slow client gets
+    the worker SIGKILLed before the lifespan shutdown runs. Here requests get
+    graceful_timeout - SHUTDOWN_RESERVE seconds and are cancelled after that.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(1, self.cfg.graceful_timeout - SHUTDOWN_RESERVE)
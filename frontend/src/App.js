@@ -5,6 +5,7 @@ import { motion, AnimatePresence } from "framer-motion";
 import { Toaster } from "./components/ui/toaster";
 import { useToast } from "./hooks/use-toast";
 import axios from "axios";
+import { fetchPdfPage } from "./lib/pdfs";
 
 // Import new animated components
 import AnimatedHeader from "./components/layout/AnimatedHeader";
@@ -379,6 +380,8 @@ const Notes = () => {
   const [filteredPdfs, setFilteredPdfs] = useState([]);
   const [examFilter, setExamFilter] = useState('all');
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const { toast } = useToast();
 
   useEffect(() => {
@@ -395,8 +398,9 @@ const Notes = () => {
 
   const fetchPdfs = async () => {
     try {
-      const response = await axios.get(`${API}/pdfs`);
-      setPdfs(response.data);
+      const page = await fetchPdfPage(`${API}/pdfs`);
+      setPdfs(page.pdfs);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       toast({
         title: "Error",
@@ -408,6 +412,23 @@ const Notes = () => {
     }
   };
 
+  const loadMorePdfs = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await fetchPdfPage(`${API}/pdfs`, nextCursor);
+      setPdfs((loaded) => [...loaded, ...page.pdfs]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      toast({
+        title: "Error",
+        description: "Failed to fetch more study materials",
+        variant: "destructive"
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const downloadPdf = async (pdfId, title) => {
     try {
       const response = await axios.get(`${API}/pdfs/download/${pdfId}`, {
@@ -565,6 +586,20 @@ const Notes = () => {
             </div>
           )}
 
+          {nextCursor && !loading && (
+            <div className="flex justify-center mt-12">
+              <motion.button
+                onClick={loadMorePdfs}
+                disabled={loadingMore}
+                className="px-8 py-3 rounded-full font-medium bg-white text-gray-700 hover:bg-gray-50 border border-gray-200 disabled:opacity-50"
+                whileHover={{ scale: 1.05 }}
+                whileTap={{ scale: 0.95 }}
+              >
+                {loadingMore ? 'Loading...' : 'Load more materials'}
+              </motion.button>
+            </div>
+          )}
+
           {filteredPdfs.length === 0 && !loading && (
             <motion.div
               className="text-center py-20"
@@ -966,14 +1001,15 @@ const Admin = () => {
     setLoading(true);
 
     try {
-      // Test authentication with a simple API call
+      // Exchange the credentials for a short-lived admin token
       const auth = window.btoa(`${credentials.username}:${credentials.password}`);
-      await axios.get(`${API}/admin/contacts`, {
+      const response = await axios.post(`${API}/admin/login`, null, {
         headers: { Authorization: `Basic ${auth}` }
       });
       
       setIsAuthenticated(true);
-      localStorage.setItem('adminAuth', auth);
+      localStorage.setItem('adminToken', response.data.access_token);
+      localStorage.setItem('adminTokenExpires', String(Date.now() + response.data.expires_in * 1000));
       toast({
         title: "Success",
         description: "Login successful"
@@ -991,19 +1027,54 @@ const Admin = () => {
 
   const handleLogout = () => {
     setIsAuthenticated(false);
-    localStorage.removeItem('adminAuth');
+    localStorage.removeItem('adminToken');
+    localStorage.removeItem('adminTokenExpires');
     setCredentials({ username: '', password: '' });
     setCurrentView('pdfs');
   };
 
   // Check if already authenticated
   useEffect(() => {
-    const savedAuth = localStorage.getItem('adminAuth');
-    if (savedAuth) {
+    const savedToken = localStorage.getItem('adminToken');
+    const expires = Number(localStorage.getItem('adminTokenExpires') || 0);
+    if (savedToken && expires > Date.now()) {
       setIsAuthenticated(true);
     }
   }, []);
 
+  // Admin tokens are short-lived and not refreshed, go back to the login form
+  // when the token runs out or the API stops accepting it
+  useEffect(() => {
+    if (!isAuthenticated) return undefined;
+
+    const sessionExpired = () => {
+      handleLogout();
+      toast({
+        title: "Session expired",
+        description: "Please log in again",
+        variant: "destructive"
+      });
+    };
+
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      (error) => {
+        const url = error.config?.url || '';
+        if (error.response?.status === 401 && url.startsWith(`${API}/admin`) && !url.startsWith(`${API}/admin/login`)) {
+          sessionExpired();
+        }
+        return Promise.reject(error);
+      }
+    );
+    const expires = Number(localStorage.getItem('adminTokenExpires') || 0);
+    const timer = setTimeout(sessionExpired, Math.max(expires - Date.now(), 0));
+
+    return () => {
+      axios.interceptors.response.eject(interceptor);
+      clearTimeout(timer);
+    };
+  }, [isAuthenticated]);
+
   if (!isAuthenticated) {
     return (
       <PageTransition>
@@ -1128,6 +1199,8 @@ const Admin = () => {
 // Admin Content Component - Fully implemented admin functionality
 const AdminContent = ({ currentView }) => {
   const [pdfs, setPdfs] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [contacts, setContacts] = useState([]);
   const [schedules, setSchedules] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -1136,16 +1209,17 @@ const AdminContent = ({ currentView }) => {
 
   // Get auth header
   const getAuthHeader = () => {
-    const auth = localStorage.getItem('adminAuth');
-    return auth ? { 'Authorization': `Basic ${auth}` } : {};
+    const token = localStorage.getItem('adminToken');
+    return token ? { 'Authorization': `Bearer ${token}` } : {};
   };
 
   // PDF Management Functions
   const fetchPdfs = async () => {
     try {
       setLoading(true);
-      const response = await axios.get(`${API}/pdfs`);
-      setPdfs(response.data);
+      const page = await fetchPdfPage(`${API}/pdfs`);
+      setPdfs(page.pdfs);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       toast({
         title: "Error",
@@ -1157,18 +1231,74 @@ const AdminContent = ({ currentView }) => {
     }
   };
 
+  const loadMorePdfs = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await fetchPdfPage(`${API}/pdfs`, nextCursor);
+      setPdfs((loaded) => [...loaded, ...page.pdfs]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      toast({
+        title: "Error",
+        description: "Failed to fetch more PDFs",
+        variant: "destructive"
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Sends the file straight to storage, the API only checks its size and hash afterwards
+  const uploadPdfDirect = async (formData) => {
+    const file = formData.get('file');
+    const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    const sha256 = Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+
+    const { data: target } = await axios.post(`${API}/admin/pdfs/uploads`, {
+      title: formData.get('title'),
+      exam_type: formData.get('exam_type'),
+      subject: formData.get('subject'),
+      batch: formData.get('batch'),
+      description: formData.get('description') || null,
+      filename: file.name,
+      size: file.size,
+      sha256
+    }, { headers: getAuthHeader() });
+
+    // Local storage hands out a path on this API, S3 a bucket URL
+    const url = target.url.startsWith('/') ? `${BACKEND_URL}${target.url}` : target.url;
+    if (target.method === 'POST') {
+      const form = new FormData();
+      Object.entries(target.fields).forEach(([name, value]) => form.append(name, value));
+      // S3 ignores form fields after the file
+      form.append('file', file);
+      await axios.post(url, form);
+    } else {
+      await axios.put(url, file, { headers: { 'Content-Type': 'application/pdf' } });
+    }
+
+    await axios.post(`${API}/admin/pdfs/uploads/${target.upload_id}/complete`, null, {
+      headers: getAuthHeader()
+    });
+  };
+
   const handlePdfUpload = async (event) => {
     event.preventDefault();
     const formData = new FormData(event.target);
     
     try {
       setUploadLoading(true);
-      await axios.post(`${API}/admin/pdfs`, formData, {
-        headers: {
-          ...getAuthHeader(),
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      if (window.crypto?.subtle) {
+        await uploadPdfDirect(formData);
+      } else {
+        // Hashing needs a secure context, fall back to sending the file through the API
+        await axios.post(`${API}/admin/pdfs`, formData, {
+          headers: {
+            ...getAuthHeader(),
+            'Content-Type': 'multipart/form-data'
+          }
+        });
+      }
       
       toast({
         title: "Success",
@@ -1443,6 +1573,15 @@ const AdminContent = ({ currentView }) => {
                 </div>
               ))
             )}
+            {nextCursor && (
+              <button
+                onClick={loadMorePdfs}
+                disabled={loadingMore}
+                className="w-full py-3 rounded-xl border border-gray-200 text-gray-700 hover:bg-gray-50 transition-colors disabled:opacity-50"
+              >
+                {loadingMore ? 'Loading...' : 'Load more PDFs'}
+              </button>
+            )}
           </div>
         )}
       </div>
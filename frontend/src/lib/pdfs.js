@@ -0,0 +1,12 @@
+import axios from "axios";
+
+// Lists show this many PDFs first and load the next page on demand, see MAX_PAGE_LIMIT in backend/pagination.py
+export const PAGE_SIZE = 50;
+
+// The list endpoints are keyset paginated, X-Next-Cursor points at the next page and is absent on the last one
+export async function fetchPdfPage(url, cursor = null, limit = PAGE_SIZE) {
+  const params = { limit };
+  if (cursor) params.cursor = cursor;
+  const response = await axios.get(url, { params });
+  return { pdfs: response.data, nextCursor: response.headers["x-next-cursor"] || null };
+}
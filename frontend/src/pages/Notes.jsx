@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchPdfPage } from '../lib/pdfs';
 import { useToast } from '../hooks/use-toast';
 import LoadingSpinner from '../components/layout/LoadingSpinner';
 
@@ -12,6 +13,8 @@ const Notes = () => {
   const [loading, setLoading] = useState(true);
   const [selectedExam, setSelectedExam] = useState('All');
   const [groupBy, setGroupBy] = useState('exam_type');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchPDFs();
@@ -19,8 +22,9 @@ const Notes = () => {
 
   const fetchPDFs = async () => {
     try {
-      const response = await axios.get(`${API}/pdfs`);
-      setPdfs(response.data);
+      const page = await fetchPdfPage(`${API}/pdfs`);
+      setPdfs(page.pdfs);
+      setNextCursor(page.nextCursor);
       setLoading(false);
     } catch (error) {
       console.error('Error fetching PDFs:', error);
@@ -34,6 +38,25 @@ const Notes = () => {
     }
   };
 
+  const loadMorePDFs = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await fetchPdfPage(`${API}/pdfs`, nextCursor);
+      setPdfs((loaded) => [...loaded, ...page.pdfs]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error fetching more PDFs:', error);
+      toast({
+        title: "Error Loading Study Materials",
+        description: "Unable to load more PDFs. Please try again.",
+        variant: "destructive",
+        duration: 5000,
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const examTypes = ['All', 'SSC', 'UPSC', 'Banking', 'Railway', 'State PSC', 'Defence'];
 
   const filteredPdfs = selectedExam === 'All' 
@@ -222,6 +245,18 @@ const Notes = () => {
               ))}
             </div>
           )}
+
+          {nextCursor && (
+            <div className="flex justify-center mt-12">
+              <button
+                onClick={loadMorePDFs}
+                disabled={loadingMore}
+                className="bg-black hover:bg-gray-800 text-white px-6 py-3 rounded-lg font-medium transition-colors duration-200 disabled:opacity-50"
+              >
+                {loadingMore ? 'Loading...' : 'Load More Materials'}
+              </button>
+            </div>
+          )}
         </div>
       </section>
     </div>
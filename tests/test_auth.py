@@ -0,0 +1,108 @@
+import sys
+from pathlib import Path
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasicCredentials
+from passlib.hash import pbkdf2_sha256
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import auth  # noqa: E402
+from auth import (  # noqa: E402
+    CredentialCache,
+    check_credentials,
+    issue_token,
+    issue_upload_token,
+    verify_admin,
+    verify_token,
+    verify_upload_token,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_credential_cache(monkeypatch):
+    monkeypatch.setattr(auth, "credential_cache", CredentialCache())
+
+
+def test_issued_token_verifies():
+    token, expires_in = issue_token("admin")
+    assert expires_in == auth.ADMIN_TOKEN_TTL
+    assert verify_token(token) == "admin"
+    bearer = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    assert verify_admin(bearer=bearer, basic=None) == "admin"
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_TOKEN_TTL", -10)
+    token, _ = issue_token("admin")
+    with pytest.raises(HTTPException) as exc:
+        verify_token(token)
+    assert exc.value.status_code == 401
+    assert exc.value.headers == {"WWW-Authenticate": "Bearer"}
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    token = jwt.encode({"sub": "admin", "exp": 2**40, "scope": "admin"}, "x" * 32, algorithm="HS256")
+    with pytest.raises(HTTPException) as exc:
+        verify_token(token)
+    assert exc.value.status_code == 401
+
+
+def test_upload_token_does_not_grant_admin_access():
+    token = issue_upload_token("upload-1", 60)
+    with pytest.raises(HTTPException) as exc:
+        verify_token(token)
+    assert exc.value.status_code == 403
+
+    verify_upload_token(token, "upload-1")
+    with pytest.raises(HTTPException):
+        verify_upload_token(token, "upload-2")
+    admin_token, _ = issue_token("admin")
+    with pytest.raises(HTTPException):
+        verify_upload_token(admin_token, "admin")
+
+
+def test_credential_cache_skips_the_hash_for_repeat_logins(monkeypatch):
+    calls = []
+
+    def verify_password(password):
+        calls.append(password)
+        return password == "secret"
+
+    monkeypatch.setattr(auth, "verify_password", verify_password)
+    good = HTTPBasicCredentials(username="admin", password="secret")
+    for _ in range(3):
+        assert check_credentials(good) == "admin"
+    assert calls == ["secret"]
+
+    # Failures are never cached, and the cache is keyed on the password too
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            check_credentials(HTTPBasicCredentials(username="admin", password="wrong"))
+        assert exc.value.status_code == 401
+    assert calls == ["secret", "wrong", "wrong"]
+
+
+def test_credential_cache_expires_and_never_stores_the_password():
+    cache = CredentialCache(ttl=-1)
+    cache.add(("admin", "secret"))
+    assert ("admin", "secret") not in cache
+
+    cache = CredentialCache()
+    cache.add(("admin", "secret"))
+    assert ("admin", "secret") in cache
+    assert ("admin", "other") not in cache
+    assert not any("secret" in str(key) for key in cache._entries._data)
+    cache.clear()
+    assert ("admin", "secret") not in cache
+
+
+def test_password_hash_takes_precedence(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_PASSWORD_HASH", pbkdf2_sha256.hash("hashed"))
+    assert auth.verify_password("hashed")
+    assert not auth.verify_password(auth.ADMIN_PASSWORD)
+
+    monkeypatch.setattr(auth, "ADMIN_PASSWORD_HASH", "not-a-hash")
+    assert not auth.verify_password("hashed")
@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from batch_writer import Journal  # noqa: E402
+
+
+def test_workers_sharing_a_journal_path_get_their_own_file(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    first, second = Journal(path), Journal(path)
+    assert first.replay() == []
+    assert second.replay() == []
+    assert (first.active_path, second.active_path) == (path, tmp_path / "journal.jsonl.1")
+
+    first.append('{"id": "a"}')
+    second.append('{"id": "b"}')
+    first.close()
+
+    # A replacement worker takes over the released journal and replays it
+    replacement = Journal(path)
+    assert replacement.replay() == ['{"id": "a"}']
+    replacement.mark_flushed(1)
+    assert path.read_text() == ""
+    replacement.close()
+    second.close()
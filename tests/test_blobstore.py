@@ -0,0 +1,188 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from starlette.requests import Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from blobstore import LocalBlobStore, NotInBucket, S3BlobStore, blob_name  # noqa: E402
+from filestore import FileStore  # noqa: E402
+from pdf_processing import ProcessingPipeline  # noqa: E402
+from search import SearchIndex  # noqa: E402
+from storage import migrate_to_s3  # noqa: E402
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+SHA = "ab" * 32
+
+
+def minimal_pdf(text):
+    stream = f"BT /F1 24 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_request():
+    return Request({"type": "http", "method": "GET", "path": "/api/pdfs/download/test", "headers": []})
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="pdfs")
+        yield client
+
+
+def test_local_put_keeps_existing_blob(tmp_path):
+    store = LocalBlobStore(tmp_path, FileStore(max_workers=2))
+    location = store.location(blob_name(SHA))
+
+    async def main():
+        for content in (b"first", b"second"):
+            spooled = tmp_path / ".upload.part"
+            spooled.write_bytes(content)
+            await store.put(spooled, location)
+            assert not spooled.exists()
+        assert await store.exists(location)
+        await store.delete(location)
+        assert not await store.exists(location)
+
+    asyncio.run(main())
+    store.files.close()
+
+
+def test_s3_put_download_and_delete(s3, tmp_path):
+    store = S3BlobStore("pdfs", FileStore(max_workers=2), prefix="exam/", client=s3, spool_dir=str(tmp_path))
+    location = store.location(blob_name(SHA))
+    assert location == f"s3://pdfs/exam/ab/ab/{SHA}.pdf"
+
+    async def main():
+        spooled = tmp_path / ".upload.part"
+        spooled.write_bytes(b"%PDF-1.4 test")
+        await store.put(spooled, location)
+        assert not spooled.exists()
+        assert await store.exists(location)
+
+        async with store.readable(location) as path:
+            assert path.read_bytes() == b"%PDF-1.4 test"
+        assert not path.exists()
+
+        info = await store.download_info({"file_path": location, "filename": "notes.pdf", "file_size": 13})
+        response = store.download_response(make_request(), info)
+        assert response.status_code == 302
+        assert response.headers["location"].startswith("https://pdfs.s3.amazonaws.com/exam/ab/ab/")
+        assert "response-content-disposition" in response.headers["location"]
+
+        await store.delete(location)
+        assert not await store.exists(location)
+
+    asyncio.run(main())
+    store.files.close()
+
+
+def test_s3_writable_uploads_only_written_files(s3, tmp_path):
+    store = S3BlobStore("pdfs", FileStore(max_workers=2), client=s3, spool_dir=str(tmp_path))
+
+    async def main():
+        async with store.writable(store.location("thumbnails/a.jpg")) as path:
+            path.write_bytes(b"jpeg")
+        async with store.writable(store.location("thumbnails/b.jpg")):
+            pass
+
+    asyncio.run(main())
+    store.files.close()
+    keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket="pdfs")["Contents"]]
+    assert keys == ["thumbnails/a.jpg"]
+    assert s3.head_object(Bucket="pdfs", Key="thumbnails/a.jpg")["ContentType"] == "image/jpeg"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_s3_records_get_their_text_from_the_pipeline(s3, tmp_path):
+    pytest.importorskip("pypdf")
+    pytest.importorskip("pypdfium2")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    store = S3BlobStore("pdfs", FileStore(max_workers=2), client=s3, spool_dir=str(tmp_path))
+    index = SearchIndex()
+    location = store.location(blob_name(SHA))
+    pdf = {"id": "notes", "title": "Algebra", "file_path": location, "sha256": SHA, "processing_status": "pending"}
+
+    async def main():
+        spooled = tmp_path / ".upload.part"
+        spooled.write_bytes(minimal_pdf("quadratic equations"))
+        await store.put(spooled, location)
+        await db.pdf_documents.insert_one(dict(pdf))
+        # Indexed by metadata, the text is only read through the store by the pipeline
+        await index.reconcile(db)
+        assert index.search("quadratic") == []
+
+        pipeline = ProcessingPipeline(db, store, on_done=index.refresh)
+        pipeline._executor = ThreadPoolExecutor(max_workers=1)
+        await pipeline._run(pdf)
+        pipeline._executor.shutdown()
+
+    asyncio.run(main())
+    store.files.close()
+    assert [doc_id for doc_id, _ in index.search("quadratic")] == ["notes"]
+    assert s3.head_object(Bucket="pdfs", Key=f"thumbnails/{SHA}.jpg")["ContentLength"] > 0
+
+
+def test_local_records_move_to_s3(s3, tmp_path):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    local = LocalBlobStore(tmp_path, FileStore(max_workers=2))
+    store = S3BlobStore("pdfs", FileStore(max_workers=2), client=s3, spool_dir=str(tmp_path))
+    local_path = Path(local.location(blob_name(SHA)))
+    local_path.parent.mkdir(parents=True)
+    local_path.write_bytes(b"%PDF-1.4 test")
+    (tmp_path / "thumbnails").mkdir()
+    (tmp_path / "thumbnails" / f"{SHA}.jpg").write_bytes(b"jpeg")
+    pdf = {"id": "notes", "filename": "notes.pdf", "file_path": str(local_path), "sha256": SHA, "optimized_path": "gone"}
+
+    async def main():
+        await db.pdf_blobs.insert_one({"sha256": SHA, "ref_count": 1, "path": str(local_path), "size": 13})
+        await db.pdf_documents.insert_one(dict(pdf))
+        # Until it is migrated the record can't be served from the bucket
+        with pytest.raises(NotInBucket):
+            await store.download_info(pdf)
+
+        assert await migrate_to_s3(db, store, tmp_path) == 1
+        assert await migrate_to_s3(db, store, tmp_path) == 0
+        record = await db.pdf_documents.find_one({"id": "notes"}, {"_id": 0})
+        assert record["file_path"] == store.location(blob_name(SHA))
+        assert "optimized_path" not in record
+        assert await store.exists(record["file_path"])
+        assert await store.exists(store.location(f"thumbnails/{SHA}.jpg"))
+        assert (await db.pdf_blobs.find_one({"sha256": SHA}))["path"] == record["file_path"]
+
+        # Files left over from local storage can still be deleted through the S3 store
+        await store.delete(str(local_path))
+        assert not local_path.exists()
+
+    asyncio.run(main())
+    store.files.close()
+    local.files.close()
@@ -0,0 +1,136 @@
+import asyncio
+import io
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import UploadFile
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+# The Motor client is created with connect=False, importing the app opens no connection
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+os.environ.setdefault("SEARCH_INDEX_PATH", "")
+os.environ.setdefault("CONTACT_JOURNAL_PATH", "")
+
+import server  # noqa: E402
+from blobstore import LocalBlobStore  # noqa: E402
+from filestore import FileStore  # noqa: E402
+from server import BulkDeleteRequest, ClassScheduleCreate  # noqa: E402
+
+
+@pytest.fixture
+def app_state(tmp_path, monkeypatch):
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    store = LocalBlobStore(tmp_path, FileStore(max_workers=2))
+    store.spool_dir.mkdir(parents=True, exist_ok=True)
+    changed = []
+
+    async def pdfs_changed(*ids):
+        changed.extend(ids)
+
+    async def schedule_changed(*ids):
+        changed.extend(ids)
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "blob_store", store)
+    monkeypatch.setattr(server, "pdfs_changed", pdfs_changed)
+    monkeypatch.setattr(server, "schedule_changed", schedule_changed)
+    monkeypatch.setattr(server, "start_processing", lambda pdf_doc: None)
+    return db, changed
+
+
+def upload(filename, content=b"%PDF-1.4 bulk"):
+    return UploadFile(file=io.BytesIO(content), filename=filename, size=len(content))
+
+
+def bulk_upload(files, titles=()):
+    return server.bulk_upload_pdfs(
+        files=files, exam_type="SSC", subject="Maths", batch="2024", titles=list(titles), description=None, admin="admin"
+    )
+
+
+def test_bulk_upload_reports_each_file(app_state, monkeypatch):
+    db, changed = app_state
+    store_upload = server.store_upload
+
+    async def failing_store_upload(db, file, store):
+        if file.filename == "broken.pdf":
+            raise RuntimeError("disk full")
+        return await store_upload(db, file, store)
+
+    monkeypatch.setattr(server, "store_upload", failing_store_upload)
+
+    async def main():
+        files = [upload("algebra.pdf"), upload("notes.txt"), upload("broken.pdf"), upload("geometry.pdf", b"%PDF-1.4 other")]
+        result = await bulk_upload(files, titles=["Algebra"])
+
+        assert (result.succeeded, result.failed) == (2, 2)
+        assert [(r.index, r.filename, r.status) for r in result.results] == [
+            (0, "algebra.pdf", "created"),
+            (1, "notes.txt", "error"),
+            (2, "broken.pdf", "error"),
+            (3, "geometry.pdf", "created"),
+        ]
+        assert result.results[1].detail == "Only PDF files are allowed"
+        assert result.results[2].detail == "disk full"
+
+        records = await db.pdf_documents.find({}, {"_id": 0}).to_list(length=None)
+        assert {r["id"]: r["title"] for r in records} == {result.results[0].id: "Algebra", result.results[3].id: "geometry"}
+        assert sorted(changed) == sorted([result.results[0].id, result.results[3].id])
+
+    asyncio.run(main())
+
+
+def test_bulk_delete_reports_missing_and_failed_ids(app_state, monkeypatch):
+    db, changed = app_state
+
+    async def main():
+        created = await bulk_upload([upload("a.pdf", b"%PDF-1.4 a"), upload("b.pdf", b"%PDF-1.4 b")])
+        keep, broken = (r.id for r in created.results)
+        broken_sha = (await db.pdf_documents.find_one({"id": broken}))["sha256"]
+        release_blob = server.release_blob
+
+        async def failing_release_blob(db, sha256, store):
+            if sha256 == broken_sha:
+                raise OSError("volume unavailable")
+            return await release_blob(db, sha256, store)
+
+        monkeypatch.setattr(server, "release_blob", failing_release_blob)
+        changed.clear()
+
+        result = await server.bulk_delete_pdfs(BulkDeleteRequest(ids=[keep, "missing", broken]), admin="admin")
+
+        assert (result.succeeded, result.failed) == (1, 2)
+        assert [(r.index, r.id, r.status) for r in result.results] == [
+            (0, keep, "deleted"),
+            (1, "missing", "not_found"),
+            (2, broken, "error"),
+        ]
+        assert "volume unavailable" in result.results[2].detail
+        # The record goes either way, only the file removal failed
+        assert await db.pdf_documents.count_documents({}) == 0
+        assert sorted(changed) == sorted([keep, broken])
+
+    asyncio.run(main())
+
+
+def test_bulk_schedule_create_and_delete(app_state):
+    db, changed = app_state
+    schedule = ClassScheduleCreate(exam_type="SSC", subject="Maths", day_of_week="Monday", time="10:00", is_online=False)
+
+    async def main():
+        created = await server.bulk_create_class_schedules([schedule, schedule], admin="admin")
+        assert (created.succeeded, created.failed) == (2, 0)
+        ids = [r.id for r in created.results]
+
+        result = await server.bulk_delete_class_schedules(BulkDeleteRequest(ids=[ids[0], "missing"]), admin="admin")
+        assert [(r.index, r.status) for r in result.results] == [(0, "deleted"), (1, "not_found")]
+        assert (result.succeeded, result.failed) == (1, 1)
+        assert await db.class_schedules.distinct("id") == [ids[1]]
+
+    asyncio.run(main())
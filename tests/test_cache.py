@@ -0,0 +1,103 @@
+import asyncio
+import gzip
+import json
+import sys
+from pathlib import Path
+
+from fastapi import Request, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from cache import MemoryBackend, ResponseCache  # noqa: E402
+from compression import MIN_COMPRESS_SIZE  # noqa: E402
+
+BODY = json.dumps([{"id": str(i), "title": "Polity notes"} for i in range(MIN_COMPRESS_SIZE // 10)]).encode()
+
+
+def make_request(path="/api/pdfs", query="limit=50&exam_type=upsc", accept_encoding=None):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": headers})
+
+
+class Builder:
+    def __init__(self, body=BODY):
+        self.body = body
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return Response(content=self.body, media_type="application/json", headers={"X-Next-Cursor": "abc"})
+
+
+def test_request_key_ignores_query_parameter_order():
+    assert ResponseCache.request_key(make_request(query="a=1&b=2")) == ResponseCache.request_key(make_request(query="b=2&a=1"))
+    assert ResponseCache.request_key(make_request(query="a=1")) != ResponseCache.request_key(make_request(query="a=2"))
+
+
+def test_invalidate_bumps_only_its_namespace():
+    cache = ResponseCache(MemoryBackend(64, 60))
+    pdfs, schedule = Builder(), Builder(b"[]")
+
+    async def main():
+        await cache.get_or_build("pdfs", make_request(), pdfs)
+        await cache.get_or_build("schedule", make_request("/api/schedule", ""), schedule)
+        hit = await cache.get_or_build("pdfs", make_request(), pdfs)
+        assert hit.headers["X-Cache"] == "HIT"
+        assert hit.headers["X-Next-Cursor"] == "abc"
+        assert hit.body == BODY
+
+        await cache.invalidate("pdfs")
+        assert await cache.backend.version("pdfs") == 1
+        assert await cache.backend.version("schedule") == 0
+
+        miss = await cache.get_or_build("pdfs", make_request(), pdfs)
+        assert miss.headers["X-Cache"] == "MISS"
+        kept = await cache.get_or_build("schedule", make_request("/api/schedule", ""), schedule)
+        assert kept.headers["X-Cache"] == "HIT"
+
+    asyncio.run(main())
+    assert (pdfs.calls, schedule.calls) == (2, 1)
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_compressed_variant_is_cached_next_to_the_plain_payload():
+    cache = ResponseCache(MemoryBackend(64, 60))
+    build = Builder()
+
+    async def main():
+        plain = await cache.get_or_build("pdfs", make_request(), build)
+        assert "Content-Encoding" not in plain.headers
+        key = f"pdfs:0:{ResponseCache.request_key(make_request())}"
+        assert await cache.backend.get(key) is not None
+        assert await cache.backend.get(f"{key}:gzip") is None
+
+        # The first gzip request compresses the cached payload, the next one reuses it
+        first = await cache.get_or_build("pdfs", make_request(accept_encoding="gzip"), build)
+        second = await cache.get_or_build("pdfs", make_request(accept_encoding="gzip"), build)
+        for response in (first, second):
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert response.headers["X-Cache"] == "HIT"
+            assert gzip.decompress(response.body) == BODY
+        assert await cache.backend.get(f"{key}:gzip") is not None
+
+        # Variants live under the versioned key, so a bump drops them too
+        await cache.invalidate("pdfs")
+        again = await cache.get_or_build("pdfs", make_request(accept_encoding="gzip"), build)
+        assert again.headers["X-Cache"] == "MISS"
+        assert gzip.decompress(again.body) == BODY
+
+    asyncio.run(main())
+    assert build.calls == 2
+    assert cache.compressions == 2
+
+
+def test_small_bodies_are_not_compressed():
+    cache = ResponseCache(MemoryBackend(64, 60))
+
+    async def main():
+        response = await cache.get_or_build("schedule", make_request(accept_encoding="gzip"), Builder(b"[]"))
+        assert "Content-Encoding" not in response.headers
+        assert response.body == b"[]"
+
+    asyncio.run(main())
+    assert cache.compressions == 0
@@ -0,0 +1,145 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import change_feed  # noqa: E402
+from change_feed import ChangeFeed  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def test_polling_nodes_see_each_others_changes(monkeypatch):
+    monkeypatch.setattr(change_feed, "CHANGE_FEED_POLL_INTERVAL", 0.01)
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    applied = []
+
+    async def refresh(ids):
+        applied.append(ids)
+
+    async def main():
+        writer = ChangeFeed(db, {"pdf_documents": refresh}, mode="poll")
+        reader = ChangeFeed(db, {"pdf_documents": refresh}, mode="poll")
+        reader.start()
+        await asyncio.sleep(0.05)
+        await writer.publish("pdf_documents", ["a"])
+        await writer.publish("pdf_documents", ["b", "c"])
+        await asyncio.sleep(0.05)
+        # The writer skips its own changes
+        writer.start()
+        await asyncio.sleep(0.05)
+        await writer.publish("pdf_documents", ["d"])
+        await asyncio.sleep(0.05)
+        await writer.stop()
+        await reader.stop()
+
+    asyncio.run(main())
+    assert applied == [{"a", "b", "c"}, {"d"}]
+
+
+class FakeStream:
+    """Hands out batches of change events, a None ends a batch."""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def try_next(self):
+        if self.events:
+            return self.events.pop(0)
+        await asyncio.sleep(0.01)
+        return None
+
+
+class WatchableDB:
+    def __init__(self, db, events):
+        self.db = db
+        self.events = events
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def __getitem__(self, name):
+        return self.db[name]
+
+    def watch(self, pipeline, **kwargs):
+        return FakeStream(self.events)
+
+
+def test_change_stream_applies_deletes_by_id():
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    applied = []
+
+    async def refresh(ids):
+        applied.append(ids)
+
+    def change(operation, key, doc_id=None):
+        event = {"ns": {"coll": "pdf_documents"}, "operationType": operation, "documentKey": {"_id": key}}
+        if doc_id is not None:
+            event["fullDocument"] = {"id": doc_id}
+        return event
+
+    async def main():
+        existing = await db.pdf_documents.insert_one({"id": "old"})
+        events = [
+            change("delete", existing.inserted_id), None,
+            change("insert", "k1", "new"), change("delete", "k1"), None,
+            # Inserted while the stream wasn't open, there is no telling which document it was
+            change("delete", "k2"), None,
+        ]
+        feed = ChangeFeed(WatchableDB(db, events), {"pdf_documents": refresh}, name="test")
+        feed.start()
+        await asyncio.sleep(0.1)
+        await feed.stop()
+        return feed.stats()
+
+    stats = asyncio.run(main())
+    assert applied == [{"old"}, {"new"}, None]
+    assert stats["full_refreshes"] == 1
+
+
+def test_sync_indexes_changed_and_drops_deleted_documents():
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    index = SearchIndex()
+    index.add("gone", {"title": "Old notes"})
+    index.add("kept", {"title": "Algebra notes"})
+
+    async def main():
+        await db.pdf_documents.insert_many([
+            {"id": "kept", "title": "Algebra notes", "extracted_text": "quadratic equations"},
+            {"id": "new", "title": "Geometry", "extracted_text": None},
+        ])
+        await index.sync(db, {"gone", "kept", "new"})
+
+    asyncio.run(main())
+    assert "gone" not in index
+    assert [doc_id for doc_id, _ in index.search("quadratic")] == ["kept"]
+    assert [doc_id for doc_id, _ in index.search("geometry")] == ["new"]
+
+
+def test_reconcile_leaves_text_extraction_to_the_pipeline():
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    index = SearchIndex()
+
+    async def main():
+        await db.pdf_documents.insert_many([
+            {"id": "done", "title": "Algebra notes", "extracted_text": "quadratic equations"},
+            # Not readable from here, reconcile must not try to open it
+            {"id": "queued", "title": "Geometry", "file_path": "s3://bucket/missing.pdf", "processing_status": "pending"},
+        ])
+        await index.reconcile(db)
+        await index.refresh({"id": "queued", "title": "Geometry", "extracted_text": "triangles"})
+
+    asyncio.run(main())
+    assert [doc_id for doc_id, _ in index.search("quadratic")] == ["done"]
+    assert [doc_id for doc_id, _ in index.search("geometry triangles")] == ["queued"]
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import direct_uploads  # noqa: E402
+from blobstore import LocalBlobStore  # noqa: E402
+from direct_uploads import (  # noqa: E402
+    COMPLETING,
+    FAILED,
+    PENDING,
+    complete_upload,
+    create_upload,
+    expire_uploads,
+    mark_completed,
+    receive_upload,
+)
+from filestore import FileStore  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+CONTENT = b"%PDF-1.4 direct upload"
+METADATA = {"title": "Notes", "exam_type": "SSC", "subject": "Maths", "batch": "A"}
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def start_upload(db, store, content=CONTENT, size=None, sha256=None):
+    target = await create_upload(
+        db, store, METADATA, "notes.pdf", size or len(content), sha256 or hashlib.sha256(content).hexdigest(),
+        local_url=lambda upload_id: f"/api/uploads/{upload_id}"
+    )
+    await receive_upload(db, store, target["upload_id"], chunks(content), None)
+    return target["upload_id"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalBlobStore(tmp_path, FileStore(max_workers=2))
+    (tmp_path / "incoming").mkdir()
+    yield store
+    store.files.close()
+
+
+def test_sweeper_reclaims_uploads_stuck_completing(store):
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+
+    async def main():
+        upload_id = await start_upload(db, store)
+        location = (await db.pdf_uploads.find_one({"id": upload_id}))["location"]
+        long_ago = datetime.now(timezone.utc) - timedelta(seconds=direct_uploads.UPLOAD_COMPLETE_TIMEOUT + 60)
+        # The process completing it died, and the upload has since expired
+        await db.pdf_uploads.update_one(
+            {"id": upload_id}, {"$set": {"status": COMPLETING, "completing_at": long_ago, "expires_at": long_ago}}
+        )
+        assert await expire_uploads(db, store) == 1
+        assert await db.pdf_uploads.count_documents({}) == 0
+        assert not await store.exists(location)
+
+        # One still completing is left alone
+        upload_id = await start_upload(db, store)
+        await complete_upload(db, store, upload_id)
+        await db.pdf_uploads.update_one({"id": upload_id}, {"$set": {"expires_at": long_ago}})
+        assert await expire_uploads(db, store) == 0
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("declared", [
+    {"sha256": "0" * 64},
+    {"size": len(CONTENT) + 5},
+])
+def test_mismatched_upload_fails_and_drops_the_staged_file(store, declared):
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+
+    async def main():
+        upload_id = await start_upload(db, store, **declared)
+        location = (await db.pdf_uploads.find_one({"id": upload_id}))["location"]
+        with pytest.raises(HTTPException) as exc:
+            await complete_upload(db, store, upload_id)
+        assert exc.value.status_code == 422
+
+        upload = await db.pdf_uploads.find_one({"id": upload_id})
+        assert upload["status"] == FAILED
+        assert upload["error"] == "size or hash mismatch"
+        assert not await store.exists(location)
+        assert await db.pdf_blobs.count_documents({}) == 0
+
+        with pytest.raises(HTTPException) as exc:
+            await complete_upload(db, store, upload_id)
+        assert (exc.value.status_code, exc.value.detail) == (409, "Upload is already failed")
+
+    asyncio.run(main())
+
+
+def test_upload_completes_once(store):
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+
+    async def main():
+        upload_id = await start_upload(db, store)
+        outcomes = await asyncio.gather(
+            complete_upload(db, store, upload_id), complete_upload(db, store, upload_id), return_exceptions=True
+        )
+        completed = [o for o in outcomes if not isinstance(o, BaseException)]
+        rejected = [o for o in outcomes if isinstance(o, HTTPException)]
+        assert len(completed) == 1 and len(rejected) == 1
+        assert rejected[0].status_code == 409
+
+        upload, location = completed[0]
+        assert await store.exists(location)
+        blob = await db.pdf_blobs.find_one({"sha256": upload["sha256"]})
+        assert blob["ref_count"] == 1
+
+        await mark_completed(db, upload_id, "pdf-1")
+        with pytest.raises(HTTPException) as exc:
+            await complete_upload(db, store, upload_id)
+        assert (exc.value.status_code, exc.value.detail) == (409, "Upload is already completed")
+        assert (await db.pdf_blobs.find_one({"sha256": upload["sha256"]}))["ref_count"] == 1
+
+    asyncio.run(main())
+
+
+def test_completing_before_the_file_arrives_keeps_the_upload_open(store):
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+
+    async def main():
+        target = await create_upload(
+            db, store, METADATA, "notes.pdf", len(CONTENT), hashlib.sha256(CONTENT).hexdigest(),
+            local_url=lambda upload_id: f"/api/uploads/{upload_id}"
+        )
+        upload_id = target["upload_id"]
+        with pytest.raises(HTTPException) as exc:
+            await complete_upload(db, store, upload_id)
+        assert exc.value.status_code == 409
+        assert (await db.pdf_uploads.find_one({"id": upload_id}))["status"] == PENDING
+
+        # The file can still be sent and the upload completed
+        await receive_upload(db, store, upload_id, chunks(CONTENT[:10], CONTENT[10:]), str(len(CONTENT)))
+        _, location = await complete_upload(db, store, upload_id)
+        assert await store.exists(location)
+
+        with pytest.raises(HTTPException) as exc:
+            await complete_upload(db, store, "missing")
+        assert exc.value.status_code == 404
+
+    asyncio.run(main())
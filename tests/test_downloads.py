@@ -0,0 +1,176 @@
+import asyncio
+import sys
+from email.utils import formatdate
+from pathlib import Path
+
+import pytest
+from starlette.requests import Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import downloads  # noqa: E402
+from downloads import (  # noqa: E402
+    DownloadInfo,
+    RangeNotSatisfiable,
+    build_file_response,
+    is_not_modified,
+    parse_range,
+)
+
+
+def make_request(headers=None):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/pdfs/download/test",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    return Request(scope)
+
+
+def make_info(tmp_path):
+    path = tmp_path / "ab" / "cd" / "abcd.pdf"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"%PDF-1.4 test")
+    return DownloadInfo(path=path, filename="notes.pdf", etag='"abcd"', size=13, last_modified=0.0)
+
+
+def test_x_accel_redirect_headers(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, "DELIVERY_MODE", "x-accel")
+    info = make_info(tmp_path)
+
+    response = build_file_response(make_request(), info, tmp_path)
+
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == "/protected-uploads/ab/cd/abcd.pdf"
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["content-disposition"] == 'attachment; filename="notes.pdf"'
+    assert response.headers["etag"] == '"abcd"'
+    assert response.body == b""
+
+
+def test_x_sendfile_headers(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, "DELIVERY_MODE", "x-sendfile")
+    info = make_info(tmp_path)
+
+    response = build_file_response(make_request(), info, tmp_path)
+
+    assert response.headers["x-sendfile"] == str(info.path)
+    assert "x-accel-redirect" not in response.headers
+
+
+def test_offload_still_answers_conditional_get(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, "DELIVERY_MODE", "x-accel")
+    info = make_info(tmp_path)
+
+    response = build_file_response(make_request({"If-None-Match": '"abcd"'}), info, tmp_path)
+
+    assert response.status_code == 304
+    assert "x-accel-redirect" not in response.headers
+
+
+def test_offload_falls_back_outside_upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, "DELIVERY_MODE", "x-accel")
+    info = make_info(tmp_path)
+
+    response = build_file_response(make_request(), info, tmp_path / "elsewhere")
+
+    assert "x-accel-redirect" not in response.headers
+    assert response.path == info.path
+
+
+def read_body(response):
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(collect())
+
+
+def test_parse_range_suffix_open_and_merged():
+    assert parse_range("bytes=0-3", 13) == [(0, 3)]
+    assert parse_range("bytes=10-", 13) == [(10, 12)]
+    assert parse_range("bytes=-4", 13) == [(9, 12)]
+    # Longer than the file: the whole file
+    assert parse_range("bytes=-100", 13) == [(0, 12)]
+    # Past the end is clamped
+    assert parse_range("bytes=5-100", 13) == [(5, 12)]
+    # Overlapping and adjacent ranges are merged, the result is sorted
+    assert parse_range("bytes=8-10,0-2,3-4,9-12", 13) == [(0, 4), (8, 12)]
+
+
+def test_parse_range_ignores_invalid_headers():
+    assert parse_range("items=0-3", 13) is None
+    assert parse_range("bytes=3-1", 13) is None
+    assert parse_range("bytes=a-b", 13) is None
+    assert parse_range("bytes=5", 13) is None
+    many = ",".join(f"{i * 2}-{i * 2}" for i in range(20))
+    assert parse_range(f"bytes={many}", 100) is None
+
+
+def test_parse_range_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=13-20", 13)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=-0", 13)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(tmp_path):
+    info = make_info(tmp_path)
+    later = formatdate(1000.0, usegmt=True)
+
+    assert is_not_modified(make_request({"If-None-Match": 'W/"abcd", "other"'}), info)
+    assert is_not_modified(make_request({"If-None-Match": "*"}), info)
+    # A non-matching tag wins over a date that would have matched
+    assert not is_not_modified(make_request({"If-None-Match": '"other"', "If-Modified-Since": later}), info)
+    assert is_not_modified(make_request({"If-Modified-Since": later}), info)
+    assert not is_not_modified(make_request({"If-Modified-Since": formatdate(-10.0, usegmt=True)}), info)
+    assert not is_not_modified(make_request({"If-Modified-Since": "yesterday"}), info)
+
+
+def test_single_range_response(tmp_path):
+    info = make_info(tmp_path)
+
+    response = build_file_response(make_request({"Range": "bytes=-4"}), info, tmp_path)
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 9-12/13"
+    assert response.headers["content-length"] == "4"
+    assert read_body(response) == b"test"
+
+
+def test_unsatisfiable_range_response(tmp_path):
+    info = make_info(tmp_path)
+
+    response = build_file_response(make_request({"Range": "bytes=50-"}), info, tmp_path)
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */13"
+
+
+def test_if_range_mismatch_serves_whole_file(tmp_path):
+    info = make_info(tmp_path)
+
+    weak = build_file_response(make_request({"Range": "bytes=0-3", "If-Range": 'W/"abcd"'}), info, tmp_path)
+    stale = build_file_response(make_request({"Range": "bytes=0-3", "If-Range": '"old"'}), info, tmp_path)
+    matching = build_file_response(make_request({"Range": "bytes=0-3", "If-Range": '"abcd"'}), info, tmp_path)
+
+    assert (weak.status_code, stale.status_code, matching.status_code) == (200, 200, 206)
+
+
+def test_multipart_byteranges_framing(tmp_path):
+    info = make_info(tmp_path)
+
+    response = build_file_response(make_request({"Range": "bytes=0-3,9-12"}), info, tmp_path)
+
+    assert response.status_code == 206
+    media_type, _, boundary = response.headers["content-type"].partition("; boundary=")
+    assert media_type == "multipart/byteranges"
+    body = read_body(response)
+    assert int(response.headers["content-length"]) == len(body)
+    assert body == (
+        f"--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 0-3/13\r\n\r\n".encode()
+        + b"%PDF"
+        + f"\r\n--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 9-12/13\r\n\r\n".encode()
+        + b"test"
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
@@ -0,0 +1,43 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from filestore import FileStore  # noqa: E402
+
+
+def test_concurrent_stats_share_one_call(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF")
+    store = FileStore(max_workers=2)
+
+    async def main():
+        results = await asyncio.gather(*(store.stat(path) for _ in range(10)))
+        assert all(result.st_size == 4 for result in results)
+        # Served from the cache now
+        assert await store.exists(path)
+
+    asyncio.run(main())
+    store.close()
+    assert store.calls == 1
+    assert store.stat_coalesced == 9
+    assert store.stat_hits == 1
+
+
+def test_missing_files_are_cached_until_invalidated(tmp_path):
+    path = tmp_path / "b.pdf"
+    store = FileStore(max_workers=2)
+
+    async def main():
+        assert not await store.exists(path)
+        path.write_bytes(b"%PDF")
+        assert not await store.exists(path)
+        store.invalidate(path)
+        assert await store.exists(path)
+        await store.unlink(path)
+        assert not await store.exists(path)
+
+    asyncio.run(main())
+    store.close()
+    assert not path.exists()
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from indexes import _plan_stages, assert_no_collscan, ensure_indexes  # noqa: E402
+
+# The plans can only be checked against a real server, point MONGO_URL at one to run this
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+
+def test_plan_stages_walks_nested_plans():
+    plan = {
+        "stage": "FETCH",
+        "inputStage": {
+            "stage": "OR",
+            "inputStages": [{"stage": "IXSCAN"}, {"stage": "FETCH", "inputStage": {"stage": "COLLSCAN"}}],
+        },
+    }
+    assert _plan_stages(plan) == ["FETCH", "OR", "IXSCAN", "FETCH", "COLLSCAN"]
+
+
+def test_route_queries_use_an_index():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.errors import PyMongoError
+
+    async def main():
+        client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=1000)
+        try:
+            await client.admin.command("ping")
+        except PyMongoError:
+            client.close()
+            pytest.skip(f"no MongoDB server at {MONGO_URL}")
+
+        db = client[f"test_indexes_{uuid.uuid4().hex[:8]}"]
+        try:
+            await ensure_indexes(db)
+            await assert_no_collscan(db)
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    asyncio.run(main())
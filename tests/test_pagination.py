@@ -0,0 +1,82 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pagination import CURSOR_FIELDS, build_projection, decode_cursor, encode_cursor, fetch_page  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+# Mongo hands dates back as naive UTC with millisecond precision
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(START, "pdf-7")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (START, "pdf-7")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(START, "x")[:-3], "e30"])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_fetch_page_walks_every_document_once_with_ties_on_upload_date():
+    async def main():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        # Bulk uploads share a timestamp, so half the rows tie on upload_date
+        docs = [{"id": f"pdf-{i:02d}", "upload_date": START + timedelta(minutes=i // 4)} for i in range(13)]
+        await db.pdf_documents.insert_many([dict(d) for d in docs])
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            page, cursor = await fetch_page(db.pdf_documents, {}, limit=3, cursor=cursor, projection={"_id": 0})
+            seen.extend(page)
+            pages += 1
+            if cursor is None:
+                break
+
+        expected = sorted(docs, key=lambda d: (d["upload_date"], d["id"]), reverse=True)
+        assert seen == expected
+        assert pages == 5
+
+    asyncio.run(main())
+
+
+def test_fetch_page_keeps_the_query_filter_across_pages():
+    async def main():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        await db.pdf_documents.insert_many([
+            {"id": f"pdf-{i}", "upload_date": START, "exam_type": "ssc" if i % 2 else "upsc"} for i in range(6)
+        ])
+        first, cursor = await fetch_page(db.pdf_documents, {"exam_type": "ssc"}, limit=2, projection={"_id": 0})
+        second, cursor = await fetch_page(db.pdf_documents, {"exam_type": "ssc"}, limit=2, cursor=cursor, projection={"_id": 0})
+
+        assert [d["id"] for d in first + second] == ["pdf-5", "pdf-3", "pdf-1"]
+        assert cursor is None
+
+    asyncio.run(main())
+
+
+def test_build_projection_always_includes_cursor_fields():
+    projection = build_projection("title, exam_type", ["id", "upload_date", "title", "exam_type"])
+
+    assert projection == {"id": 1, "upload_date": 1, "title": 1, "exam_type": 1, "_id": 0}
+    assert all(field in projection for field in CURSOR_FIELDS)
+    assert build_projection(None, ["id"]) is None
+    assert build_projection("", ["id"]) is None
+
+
+def test_build_projection_rejects_unknown_fields():
+    with pytest.raises(HTTPException) as exc:
+        build_projection("title,file_path,secret", ["id", "upload_date", "title"])
+    assert exc.value.status_code == 400
+    assert exc.value.detail == "Unknown fields: file_path, secret"
@@ -0,0 +1,74 @@
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pdf_processing  # noqa: E402
+from pdf_processing import DONE, PENDING, PROCESSING, ProcessingPipeline  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+class RecordingStore:
+    """Hands out paths as they are, counting the files fetched at the same time."""
+
+    def __init__(self):
+        self.open = 0
+        self.most_open = 0
+
+    def location(self, name):
+        return f"/nowhere/{name}"
+
+    @asynccontextmanager
+    async def readable(self, location):
+        self.open += 1
+        self.most_open = max(self.most_open, self.open)
+        try:
+            yield Path(location)
+        finally:
+            self.open -= 1
+
+    @asynccontextmanager
+    async def writable(self, location):
+        yield Path(location)
+
+
+def test_jobs_claim_and_fetch_only_once_a_worker_is_free(monkeypatch):
+    release = threading.Event()
+
+    def process_pdf(path, thumbnail_path, optimized_path=None):
+        release.wait(5)
+        return {"page_count": 1, "extracted_text": ""}
+
+    monkeypatch.setattr(pdf_processing, "process_pdf", process_pdf)
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    store = RecordingStore()
+
+    async def main():
+        pdfs = [{"id": str(i), "file_path": f"/nowhere/{i}.pdf", "processing_status": PENDING} for i in range(5)]
+        await db.pdf_documents.insert_many([dict(pdf) for pdf in pdfs])
+        pipeline = ProcessingPipeline(db, store, workers=2)
+        pipeline._executor = ThreadPoolExecutor(max_workers=2)
+        for pdf in pdfs:
+            pipeline.submit(pdf)
+        await asyncio.sleep(0.1)
+
+        statuses = [doc["processing_status"] async for doc in db.pdf_documents.find({}, sort=[("id", 1)])]
+        assert statuses.count(PROCESSING) == 2 and statuses.count(PENDING) == 3
+        assert pipeline.stats()["running"] == 2 and pipeline.stats()["queued"] == 3
+
+        release.set()
+        while pipeline._tasks:
+            await asyncio.sleep(0.01)
+        pipeline._executor.shutdown()
+        return [doc["processing_status"] async for doc in db.pdf_documents.find({})]
+
+    assert asyncio.run(main()) == [DONE] * 5
+    assert store.most_open == 2
+
@@ -0,0 +1,63 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import ratelimit  # noqa: E402
+from ratelimit import MemoryBucketStore, RateLimit, RateLimiter, build_rules, client_ip  # noqa: E402
+
+
+def make_scope(method="POST", path="/api/contact", client="10.0.0.1", headers=None):
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "client": (client, 50000),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+
+
+def test_parse_rate_limit():
+    assert RateLimit.parse("5/minute") == RateLimit(rate=5 / 60, burst=5)
+    assert RateLimit.parse("10/30") == RateLimit(rate=10 / 30, burst=10)
+    with pytest.raises(ValueError):
+        RateLimit.parse("often")
+
+
+def test_bucket_limits_per_ip_and_route(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(build_rules({"POST /api/contact": "2/minute"}), MemoryBucketStore())
+
+    async def check(**kwargs):
+        return await limiter.check(make_scope(**kwargs))
+
+    assert asyncio.run(check()) == 0
+    assert asyncio.run(check()) == 0
+    assert asyncio.run(check()) == pytest.approx(30)
+    # Other clients and unlisted routes are unaffected
+    assert asyncio.run(check(client="10.0.0.2")) == 0
+    assert asyncio.run(check(method="GET", path="/api/pdfs")) == 0
+
+    now[0] += 30
+    assert asyncio.run(check()) == 0
+
+
+def test_idle_buckets_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    store = MemoryBucketStore(sweep_interval=10)
+    limit = RateLimit.parse("6/minute")
+    asyncio.run(store.take("a", limit))
+    now[0] += 61
+    asyncio.run(store.take("b", limit))
+    assert set(store.buckets) == {"b"}
+
+
+def test_client_ip_behind_proxy():
+    scope = make_scope(client="127.0.0.1", headers={"X-Forwarded-For": "1.2.3.4, 203.0.113.9"})
+    assert client_ip(scope, trusted_proxies=0) == "127.0.0.1"
+    assert client_ip(scope, trusted_proxies=1) == "203.0.113.9"
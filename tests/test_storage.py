@@ -0,0 +1,138 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import storage  # noqa: E402
+from blobstore import LocalBlobStore, blob_name  # noqa: E402
+from filestore import FileStore  # noqa: E402
+from storage import add_blob, release_blob  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+SHA = "cd" * 32
+
+
+async def make_db():
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    await db.pdf_blobs.create_index("sha256", unique=True)
+    return db
+
+
+def spool(tmp_path, content=b"%PDF-1.4 test", name=".upload.part"):
+    path = tmp_path / "spool" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def test_add_blob_waits_for_a_delete_claimed_by_another_process(tmp_path):
+    store = LocalBlobStore(tmp_path, FileStore(max_workers=2))
+
+    async def main():
+        db = await make_db()
+        location = await add_blob(db, store, SHA, 13, lambda loc: store.put(spool(tmp_path), loc))
+        # Another process took the last reference away and is about to unlink the file
+        await db.pdf_blobs.update_one({"sha256": SHA}, {"$set": {"ref_count": 0, "deleting": datetime.now(timezone.utc)}})
+
+        adding = asyncio.create_task(add_blob(db, store, SHA, 13, lambda loc: store.put(spool(tmp_path), loc)))
+        await asyncio.sleep(0.2)
+        assert not adding.done()
+        await store.delete(location)
+        await db.pdf_blobs.delete_one({"sha256": SHA})
+
+        assert await adding == location
+        assert await store.exists(location)
+        blob = await db.pdf_blobs.find_one({"sha256": SHA})
+        assert blob["ref_count"] == 1 and blob["deleting"] is None
+
+    asyncio.run(main())
+    store.files.close()
+
+
+def test_add_blob_takes_over_a_stale_delete_claim(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "BLOB_DELETE_LEASE", 1)
+    store = LocalBlobStore(tmp_path, FileStore(max_workers=2))
+
+    async def main():
+        db = await make_db()
+        location = store.location(blob_name(SHA))
+        # The process that claimed the delete died after unlinking the file
+        await db.pdf_blobs.insert_one({
+            "sha256": SHA, "ref_count": 0, "path": location, "size": 13,
+            "deleting": datetime.now(timezone.utc) - timedelta(seconds=5),
+        })
+        location = await add_blob(db, store, SHA, 13, lambda loc: store.put(spool(tmp_path), loc))
+        assert await store.exists(location)
+        blob = await db.pdf_blobs.find_one({"sha256": SHA})
+        assert blob["ref_count"] == 1 and blob["deleting"] is None
+
+        assert await release_blob(db, SHA, store)
+        assert not await store.exists(location)
+        assert await db.pdf_blobs.count_documents({}) == 0
+
+    asyncio.run(main())
+    store.files.close()
+
+
+def test_blob_locks_are_dropped_once_released(tmp_path):
+    store = LocalBlobStore(tmp_path, FileStore(max_workers=2))
+
+    async def main():
+        db = await make_db()
+        await asyncio.gather(*(
+            add_blob(db, store, SHA, 13, lambda loc, i=i: store.put(spool(tmp_path, name=f".upload{i}.part"), loc))
+            for i in range(3)
+        ))
+        assert (await db.pdf_blobs.find_one({"sha256": SHA}))["ref_count"] == 3
+        assert storage._blob_locks == {}
+
+    asyncio.run(main())
+    store.files.close()
+
+
+def make_upload_app(limit):
+    from fastapi import FastAPI, File, UploadFile
+
+    app = FastAPI()
+    received = []
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        received.append(file.filename)
+        return {"ok": True}
+
+    app.add_middleware(storage.UploadSizeLimitMiddleware, limits={"/upload": limit})
+    return app, received
+
+
+def test_upload_size_limit_refuses_bodies_while_receiving():
+    from fastapi.testclient import TestClient
+
+    app, received = make_upload_app(64 * 1024)
+    client = TestClient(app)
+    assert client.post("/upload", files={"file": ("small.pdf", b"x" * 1024)}).status_code == 200
+
+    # Declared too large, refused before the body is read
+    response = client.post("/upload", files={"file": ("big.pdf", b"x" * 128 * 1024)})
+    assert response.status_code == 413
+
+    # No Content-Length, cut off once it passes the limit
+    boundary = "limit-test"
+    part = f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="big.pdf"\r\n\r\n'.encode()
+
+    def body():
+        yield part
+        for _ in range(16):
+            yield b"x" * 16 * 1024
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post(
+        "/upload", content=body(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    assert response.status_code == 413
+    assert received == ["small.pdf"]